@@ -13,4 +13,19 @@ validate = "remaining"  # The method is validated on remaining images
 #validate = False        # The method is not validated
 
 image_size = 512    # All images will be normalized to have this width
+dtype = "float64"   # Floating point type of the gradient and other images computed for each image
+#dtype = "float32"  # Half the memory per image, results can differ slightly (rounding)
 seed = None     # For reproducible results substitute "None" by a number
+
+# Search of the breast contour (see process_image.breast_contour)
+contour_method = "exact"      # Shortest path in the whole rectangle around the breast
+#contour_method = "pyramid"   # Coarse-to-fine search in a band around the path of a coarser level
+#contour_method = "polar"     # Dynamic programming in polar coordinates around the circle center
+pyramid_levels = 3      # Number of times the images are halved for the coarsest search
+pyramid_band = 6        # Half width, in pixels, of the band searched at each finer level
+polar_radii = (0.5, 1.5)    # Radii searched by the polar method, relative to the radius of the circle
+contour_search = "dijkstra"         # Shortest path search from the initial point of the contour
+#contour_search = "bidirectional"   # Searches from both end points of the contour until they meet
+#contour_search = "astar"           # A* guided by astar_delta times the Euclidean distance to the end point
+astar_delta = None      # Lower bound of the edge weights per unit length. None: computed from the weights
+#astar_delta = 1.85     # delta of dists.dist_with_prior, a bound for any image
@@ -1,87 +1,97 @@
 import numpy as np
-from utils import dists, scoring
-import process_image as proc
+from utils import dists, scoring, profiler
+import baseline1.process_image as proc
 from matplotlib import pyplot as plt
 import pickle
-import config
-import time
-
-models_loaded = False
-left_nipple_params = None
-right_nipple_params = None
-mean_model = None
+import baseline1.config as config
+import baseline1.registry as registry
 
 # Load the models created during trainining
-def load_models():
-    global left_nipple_params,right_nipple_params,mean_model
-    left_nipple_params = np.load("models/left_nipple_params.npy")
-    right_nipple_params = np.load("models/right_nipple_params.npy")
-    mean_model = np.load("models/mean_model.npy")
+#    args:
+#        directory - folder with the models. If None the last folder used is kept.
+# The models are kept in baseline1.registry, so this only has to be called once per
+# process (e.g. in the initializer of a worker). The files are read again only if
+# they changed. test reads the models from the registry, loading them the first 
+# time if load_models was never called.
+def load_models(directory=None):
+    registry.load(directory)
 
 
-def test(img, testing=False, ground_truth=None, debug_verbose=False, suffix = "",time_debug=True):
-    
-    if not models_loaded:
-        load_models()
-    
-    start_time = time.time()
-    times = [start_time]
+# Detect the keypoints of one image
+#    args:
+#        img - patients image
+#        testing - if true, the mean model is returned when the detection fails
+#        ground_truth - if given, the scores of the detections are also returned
+#        profile - optional utils.profiler.Profile where the time of each stage 
+#                  and the counters of the pipeline are recorded (also on failure)
+def test(img, testing=False, ground_truth=None, debug_verbose=False, suffix = "",time_debug=True,
+         profile=None):
     
-    # Preprocess_image
-    img, ori_shape, scalling_factor = proc.preprocess_img(img,
-                                ret_ori_shape=True, ret_scalling_factor=True)
+    models = registry.get_models()
     
-    # Compute gradient magnitude
-    grey = np.average(img,axis=2)
-    M = dists.gradient(grey)
-    times.append(time.time())
-    # Find breast extrema points
-    try:
-        pl,pm,pr,pt = proc.find_extrema_points2(img.shape,M)
-        times.append(time.time())
-        # Find contour of each breast
-        l_boundary = proc.breast_contour(M,pl,pm)
-        r_boundary = proc.breast_contour(M,pm,pr)
-        times.append(time.time())
-        # Find contour of each nipple
-        l_nipple = proc.nipple(img, l_boundary, left_nipple_params)
-        r_nipple = proc.nipple(img, r_boundary, right_nipple_params)
-        times.append(time.time())
-        # Save detections    
-        if debug_verbose:
-            plt.clf()
-            plt.imshow(img)
-            plt.scatter(pl[1], pl[0], c='r')
-            plt.scatter(pm[1], pm[0], c='r')
-            plt.scatter(pr[1], pr[0], c='r')
-            plt.scatter(pt[1], pt[0], c='r')
-            plt.scatter(l_nipple[1], l_nipple[0], c='r')
-            plt.scatter(r_nipple[1], r_nipple[0], c='r')
+    prof = profiler.Profile(suffix) if profile is None else profile
+    with prof:
+        # Preprocess_image
+        with profiler.stage("preprocess"):
+            img, ori_shape, scalling_factor = proc.preprocess_img(img,
+                                        ret_ori_shape=True, ret_scalling_factor=True)
+        
+        # Compute gradient magnitude
+        with profiler.stage("gradient"):
+            M = dists.color_gradient(img, dtype=config.dtype)
+        # Find breast extrema points
+        try:
+            with profiler.stage("extrema_points"):
+                pl,pm,pr,pt = proc.find_extrema_points2(img.shape,M,debug_verbose=debug_verbose)
+            # Find contour of each breast
+            with profiler.stage("breast_contour"):
+                l_boundary = proc.breast_contour(M,pl,pm,debug_verbose=debug_verbose)
+                r_boundary = proc.breast_contour(M,pm,pr,debug_verbose=debug_verbose)
+            # Find contour of each nipple
+            with profiler.stage("nipple"):
+                l_nipple = proc.nipple(img, l_boundary, models["left_nipple_params"], debug_verbose=debug_verbose)
+                r_nipple = proc.nipple(img, r_boundary, models["right_nipple_params"], debug_verbose=debug_verbose)
+            # Save detections    
+            if debug_verbose:
+                plt.clf()
+                plt.imshow(img)
+                plt.scatter(pl[1], pl[0], c='r')
+                plt.scatter(pm[1], pm[0], c='r')
+                plt.scatter(pr[1], pr[0], c='r')
+                plt.scatter(pt[1], pt[0], c='r')
+                plt.scatter(l_nipple[1], l_nipple[0], c='r')
+                plt.scatter(r_nipple[1], r_nipple[0], c='r')
 
-            plt.plot(l_boundary[:,1], l_boundary[:,0], c='r')
-            plt.plot(r_boundary[:,1], r_boundary[:,0], c='r')
+                plt.plot(l_boundary[:,1], l_boundary[:,0], c='r')
+                plt.plot(r_boundary[:,1], r_boundary[:,0], c='r')
 
-            plt.show()
+                plt.show()
 
-        detections = points_to_detections(l_boundary,r_boundary,l_nipple,r_nipple,pt,scalling_factor)
+            detections = points_to_detections(l_boundary,r_boundary,l_nipple,r_nipple,pt,scalling_factor)
 
-        if time_debug:
-            print("debug times: ","{:.1f}".format(times[1]-times[0]),"{:.1f}".format(times[2]-times[1]),
-                                  "{:.1f}".format(times[3]-times[2]),"{:.1f}".format(times[4]-times[3]))
-    except Exception as e:
-        
-        detections = mean_model/scalling_factor
-        print("Detection failed!")
-        if not testing:
-            raise e
+        except Exception as e:
+            
+            detections = models["mean_model"]/scalling_factor
+            prof.error = type(e).__name__
+            if prof.failed_stage is None:
+                print("Detection failed!")
+            else:
+                print("Detection failed in %s!" % prof.failed_stage)
+            if not testing:
+                raise e
+        finally:
+            if time_debug:
+                print("debug times:", prof.format_times())
     
     
     # If a ground truth is given this function also computes a score
-    if np.all(ground_truth) != None:
+    if ground_truth is not None:
         scores = scoring.measure_distances(detections, ground_truth, ori_shape)
         return detections, scores
         
-    print("\tFinished:", suffix, "took", time.time()-start_time, "s")
+    # The total time is also kept in the profile (prof.total)
+    if time_debug:
+        print("\tFinished:", suffix, "took", prof.total, "s")
     return detections
 
 def points_to_detections(l_boundary,r_boundary,nippleL,nippleR,jugular_notch,scalling_factor):
@@ -0,0 +1,142 @@
+# This file is part of baseline1 of the VISUM challenge
+#
+# Batch inference for baseline1. The test images are processed in parallel by a
+# pool of worker processes and the detections are written to a csv file in the
+# same order as the input images.
+#
+# Usage (from the baselines folder):
+#    python -m baseline1.predict --input /data/X_test.pickle --output predictions.csv
+
+# Outside Imports
+import os
+import sys
+import time
+import signal
+import pickle
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# VISUM Baseline Imports
+import baseline1.model as model
+import baseline1.config as config
+import baseline1.registry as registry
+from utils import profiler
+
+DEFAULT_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+
+# Derived from BaseException so that it is not caught by the generic exception
+# handler of model.test
+class ImageTimeout(BaseException):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise ImageTimeout()
+
+
+# Worker initializer: the models are loaded once per worker process
+def init_worker(models_dir):
+    model.load_models(models_dir)
+
+
+# Process a single image in a worker.
+#    args:
+#        img - patients image
+#        timeout - maximum number of seconds spent on the image (None for no limit)
+#        name - name of the image in its profile
+# If the image takes longer than timeout the mean model is used instead, as
+# model.test does when the detection fails. The profile of the stages of
+# model.test is returned as a dictionary (see utils.profiler).
+def predict_image(img, timeout=None, name=""):
+    start_time = time.time()
+    prof = profiler.Profile(name)
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    detections = None
+    try:
+        detections = model.test(img, testing=True, time_debug=False, profile=prof)
+        # Disarmed here, so the alarm can not go off after the result is known
+        _disarm(timeout)
+        timed_out = False
+    except ImageTimeout:
+        # The alarm may also go off after model.test returned, before it was disarmed:
+        # the detections are kept in that case
+        _disarm(timeout)
+        timed_out = detections is None
+        if timed_out:
+            detections = registry.get_model("mean_model")/(config.image_size/img.shape[1])
+    except BaseException:
+        _disarm(timeout)
+        raise
+    return detections, timed_out, time.time()-start_time, prof.as_dict()
+
+
+# Turns off the timer of predict_image. An ImageTimeout raised by an alarm that
+# goes off while the timer is being turned off is ignored (the timer is off after it).
+def _disarm(timeout):
+    if not timeout:
+        return
+    try:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    except ImageTimeout:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+# Run the detection on all images.
+#    args:
+#        X - list or array of images
+#        workers - number of worker processes
+#        timeout - maximum number of seconds spent on each image (None for no limit)
+#        models_dir - folder with the models created during training
+# Returns the detections in the same order as X, the number of images that
+# timed out, the total time and the profile of each image.
+def predict(X, workers=None, timeout=None, models_dir=DEFAULT_MODELS_DIR):
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(models_dir,)) as executor:
+        futures = [executor.submit(predict_image, img, timeout, str(i)) for i, img in enumerate(X)]
+        results = [future.result() for future in futures]
+
+    predictions = [detections for detections, _, _, _ in results]
+    n_timeouts = sum(timed_out for _, timed_out, _, _ in results)
+    profiles = [prof for _, _, _, prof in results]
+    return predictions, n_timeouts, time.time()-start_time, profiles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch inference for baseline1")
+    parser.add_argument("--input", default="/data/X_test.pickle",
+                        help="pickle file with the test images")
+    parser.add_argument("--output", default="predictions.csv",
+                        help="csv file where the predictions are written")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR,
+                        help="folder with the models created during training")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="seconds per image before falling back to the mean model")
+    parser.add_argument("--profile", default=None,
+                        help="json or csv file where the time of each stage is written")
+    args = parser.parse_args(argv)
+
+    with open(args.input, 'rb') as f:
+        X = pickle.load(f)
+
+    print("Predicting %d images with %d workers" % (len(X), args.workers))
+    predictions, n_timeouts, total_time, profiles = predict(X, workers=args.workers,
+                                                  timeout=args.timeout,
+                                                  models_dir=args.models_dir)
+    np.savetxt(args.output, predictions)
+
+    print("\tFinished: %d images in %.1f s (%.2f images/s), %d timeouts"
+          % (len(X), total_time, len(X)/total_time, n_timeouts))
+    print(profiler.format_summary(profiler.summarize(profiles)))
+    if args.profile:
+        profiler.write(args.profile, profiles)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
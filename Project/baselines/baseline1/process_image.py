@@ -8,7 +8,7 @@ import scipy.ndimage.morphology as morpho
 import cv2
 
 # VISUM Baseline Imports
-from utils import dists
+from utils import dists, profiler
 import baseline1.config as config
 
 
@@ -38,7 +38,7 @@ def preprocess_img(img, points=None, ret_ori_shape=False, ret_scalling_factor=Fa
     if ret_scalling_factor:
         return_list.append(scalling_factor)
        
-    if  np.all(points) != None:    
+    if points is not None:    
         # Points are scalled by the same factor
         points*=scalling_factor
         return_list.append(points)
@@ -68,32 +68,36 @@ def preprocess_img(img, points=None, ret_ori_shape=False, ret_scalling_factor=Fa
 def find_extrema_points2(shape, M, debug_verbose=True):    
     
     # Compute a distance matrix where we assign a gradient dependent value to each pixel.
-    # Only the bottom half of the image is important.
-    dist_mat = dists.dist_matrix(M)
-    subimage = [shape[0]//2,0,shape[0],shape[1]]
-    bottom_dist_mat = dist_mat[subimage[0]:subimage[2],subimage[1]:subimage[3]]
-    
-    # Computation of the shortest paths between all points in the bottom row and the middle row.
-    paths_bottom = dists.shortest_path_grid(bottom_dist_mat,start="last")
-    
-    # Computation of the shortest paths between all points in the middle row and the bottom row.
-    # "dists.shortest_path_grid" returns the paths reversed.
-    paths_middle = dists.shortest_path_grid(bottom_dist_mat,start="first")
+    # Only the bottom half of the image is important, so it is the only one computed.
+    with profiler.stage("dist_matrix"):
+        subimage = [shape[0]//2,0,shape[0],shape[1]]
+        bottom_dist_mat = dists.dist_matrix(M[subimage[0]:subimage[2],subimage[1]:subimage[3]])
+    profiler.count("vertices", bottom_dist_mat.size)
+    
+    with profiler.stage("shortest_paths"):
+        # Computation of the shortest paths between all points in the bottom row and the middle row.
+        # Paths are kept as an integer array with one path (its columns) per row.
+        paths_bottom = dists.shortest_path_grid(bottom_dist_mat,start="last",as_list=False)
+        
+        # Computation of the shortest paths between all points in the middle row and the bottom row.
+        # "dists.shortest_path_grid" returns the paths reversed.
+        paths_middle = dists.shortest_path_grid(bottom_dist_mat,start="first",as_list=False)
     
     # Computation of the strong paths between the two regions. 
     # A path is considered strong path between regions "A" and "B" if:
     #    - It is the shortest path between at least one point in "A" and region "B"
     #    - It is the shortest path between at least one point in "B" and region "A"
-    final_segments = []
-    for segment in paths_bottom:
-        if segment in paths_middle:
-            final_segments.append(segment)
+    # The paths of both sets are matched by hashing their rows.
+    with profiler.stage("strong_paths"):
+        final_segments = paths_bottom[dists.common_paths(paths_bottom, paths_middle)]
+    profiler.count("strong_paths", len(final_segments))
     
     # Select the segments which will originate the extrema points of the breast
     # The selection is done as follows:
     # - Paths which end near the middle vertical line of the image are discarded
     # - The two most central paths from the ones remaining are selected.
-    left_start,right_start = select_start_points(final_segments,shape)
+    with profiler.stage("select_start_points"):
+        left_start,right_start = select_start_points(final_segments,shape)
     
     # If debug_verbose then the gradient image is shown along with the selected candidate points
     if debug_verbose:
@@ -107,8 +111,9 @@ def find_extrema_points2(shape, M, debug_verbose=True):
     # (stop condition is met). The path stops growing if, all the last "LENGTH"
     # points have a gradient magnitude smaller than "THRESHOLD".
     # "LENGTH" and "THRESHOLD" are parameters defined by the user.
-    pel = grow_segment(M, (M.shape[0]//2,left_start))
-    per = grow_segment(M, (M.shape[0]//2,right_start))
+    with profiler.stage("grow_segments"):
+        pel = grow_segment(M, (M.shape[0]//2,left_start))
+        per = grow_segment(M, (M.shape[0]//2,right_start))
     
     # Finally the medial and jugular notch points are located.
     pm = ((pel[0]+per[0])//2,(pel[1]+per[1])//2)
@@ -131,16 +136,25 @@ def find_extrema_points2(shape, M, debug_verbose=True):
 #        M - image of the gradient magnitude
 #        pl,pr - initial and end point of the breast contour. pl should be on the left of pr
 #        debug_verbose - if true, results of intermediate steps are printed
+#        method - search method, config.contour_method if None:
+#                 "exact" - shortest path in the whole rectangle around the breast
+#                 "pyramid" - coarse-to-fine search (see pyramid_contour)
+#                 "polar" - dynamic programming in polar coordinates (see polar_contour)
+#        search - shortest path search of the "exact" and "pyramid" methods, 
+#                 config.contour_search if None (see grid_search)
 # First, a weighted graph based on the image gradient is computed. The breast contour is
 # computed as the shortest path between start and end points of the breast.
 # To avoid contours very similar to straight lines a circle between the two points is created and 
 # the weights of these points increased.
-def breast_contour(M, pl, pr, debug_verbose=True):
+def breast_contour(M, pl, pr, debug_verbose=True, method=None, search=None):
+    if method is None:
+        method = config.contour_method
     
     # The circle between the two points is created.
-    center = (np.asarray(pl)+np.asarray(pr))/2
-    radius = dists.compute_euclidean_distance(np.asarray(pl),np.asarray(pr))/2
-    shape_prior = dists.circle(center,radius,M.shape)
+    with profiler.stage("shape_prior"):
+        center = (np.asarray(pl)+np.asarray(pr))/2
+        radius = dists.compute_euclidean_distance(np.asarray(pl),np.asarray(pr))/2
+        shape_prior = dists.circle(center,radius,M.shape)
     
     # If debug_verbose then the gradient image is shown along with the previously defined circle
     if debug_verbose:
@@ -151,10 +165,6 @@ def breast_contour(M, pl, pr, debug_verbose=True):
         ax.add_artist(circle1)
         plt.savefig(config.debug_path+"circle_shown.png")
     
-    # Values on which the weights of graph edges will be based on.
-    # Gradient magnitude image "M" and a shape prior (circle)
-    weight = [M,shape_prior]
-     
     # Coordinates for the creation of the graph
     # To reduce the time needed to process each breast contour only a rectangle where the
     # contour is expected to be is used.
@@ -168,18 +178,173 @@ def breast_contour(M, pl, pr, debug_verbose=True):
                  min(pr[1]+maximum_breast_to_side, shape[1])      # right
                 ]
     
-    # The graph is built using the limits proposed
-    G = dists.build_graph(weight, {pr}, direction="all",subimage=limits,dist_func=dists.dist_with_prior)
-    
-    # Find the shortest path
-    boundary = dists.shortestPath(G, pl, dists.end_point_flag)
+    if method == "pyramid":
+        boundary = pyramid_contour(M, shape_prior, pl, pr, limits,
+                                   levels=config.pyramid_levels, band=config.pyramid_band, search=search)
+        return np.asarray(boundary)
+    elif method == "polar":
+        boundary = polar_contour(M, shape_prior, center, radius, pl, pr, limits,
+                                 radii=config.polar_radii)
+        return np.asarray(boundary)
+    elif method != "exact":
+        raise ValueError("Unknown contour method %s" % method)
+    
+    # The weights of all the edges inside the limits proposed are computed at once, based on
+    # the gradient magnitude image "M" and the shape prior (circle)
+    with profiler.stage("edge_weights"):
+        edge_weights = dists.edge_weights_with_prior(M, shape_prior, limits)
+    profiler.count("vertices", edge_weights[0].size)
+    profiler.count("edges", int(np.count_nonzero(np.isfinite(edge_weights))))
+    
+    # Find the shortest path in the 8-connected grid graph defined by the limits proposed.
+    with profiler.stage("shortest_path"):
+        boundary = grid_search(edge_weights, pl, pr, limits, search)
     boundary = np.asarray(boundary)
     
-    # Remove the last point of the boundary. In this implementation of dists.build_graph 
-    # the last point is a flag (9999,9999) so it should be removed.
-    boundary = boundary[0:-1,:]
-    
     return boundary
+
+# Shortest path between two pixels in the 8-connected grid (see dists.grid_shortest_path)
+#    args:
+#        edge_weights - weights of the edges of the pixels in subimage
+#        pl,pr - initial and end point of the path
+#        subimage - rectangle [top, left, bottom, right] of the grid
+#        search - search method, config.contour_search if None:
+#                 "dijkstra" - Dijkstra from pl
+#                 "bidirectional" - Dijkstra from pl and from pr until they meet
+#                 "astar" - A* guided by astar_delta times the Euclidean distance to pr
+#        astar_delta - lower bound of the weight per unit length, config.astar_delta if 
+#                      None, or the smallest one of the edge weights if that is also None
+# All of them return a shortest path. The vertices expanded by each one are counted by
+# the profiler ("expanded").
+def grid_search(edge_weights, pl, pr, subimage, search=None, astar_delta=None):
+    if search is None:
+        search = config.contour_search
+    if search == "dijkstra":
+        return dists.grid_shortest_path(edge_weights, pl, {pr}, subimage=subimage)
+    if search == "bidirectional":
+        return dists.bidirectional_grid_shortest_path(edge_weights, pl, {pr}, subimage=subimage)
+    if search == "astar":
+        if astar_delta is None:
+            astar_delta = config.astar_delta
+        if astar_delta is None:
+            astar_delta = dists.min_weight_per_length(edge_weights)
+        return dists.grid_shortest_path(edge_weights, pl, {pr}, subimage=subimage, astar_delta=astar_delta)
+    raise ValueError("Unknown search %s" % search)
+
+# Coarse-to-fine search of the breast contour
+#    args:
+#        M - image of the gradient magnitude
+#        shape_prior - circle between the two points (see breast_contour)
+#        pl,pr - initial and end point of the breast contour
+#        limits - rectangle [top, left, bottom, right] where the contour is searched
+#        levels - number of times the images are halved for the coarsest search
+#        band - half width, in pixels, of the band searched at each finer level
+#        search - shortest path search at each level (see grid_search)
+# The gradient (max pooling, so thin edges are kept) and the shape prior (mean) are 
+# halved "levels" times. The shortest path is computed in the whole rectangle only at 
+# the coarsest level. At each finer level it is computed again only in a band around 
+# the path of the previous level, up to the full resolution. The result is the exact 
+# shortest path whenever it lies inside the bands.
+def pyramid_contour(M, shape_prior, pl, pr, limits, levels=3, band=6, search=None):
+    top, left, bottom, right = limits
+    gradients = [M[top:bottom,left:right]]
+    priors = [shape_prior[top:bottom,left:right].astype(float)]
+    for _ in range(levels):
+        gradients.append(_halve(gradients[-1], np.max))
+        priors.append(_halve(priors[-1], np.mean))
+    
+    start = (pl[0]-top, pl[1]-left)
+    end = (pr[0]-top, pr[1]-left)
+    path = None
+    for level in range(levels, -1, -1):
+        with profiler.stage("level%d" % level):
+            level_start = (start[0]>>level, start[1]>>level)
+            level_end = (end[0]>>level, end[1]>>level)
+            shape = gradients[level].shape
+            if path is None:
+                in_band = np.ones(shape, dtype=bool)
+            else:
+                # Band around the path of the previous level, drawn as a thick polyline
+                points = [level_start] + [(2*i, 2*j) for i,j in path] + [level_end]
+                in_band = np.zeros(shape, dtype=np.uint8)
+                cv2.polylines(in_band, [np.array([[j,i] for i,j in points], dtype=np.int32)], False, 1,
+                              thickness=2*band+1)
+                in_band = in_band.astype(bool)
+            rows, cols = np.nonzero(in_band)
+            subimage = [rows.min(), cols.min(), rows.max()+1, cols.max()+1]
+            
+            # Edges with one of their pixels outside the band are removed (infinite weight)
+            edge_weights = dists.edge_weights_with_prior(gradients[level], priors[level], subimage)
+            edge_weights[dists.neighbour_planes(~in_band, subimage, fill=True)] = np.inf
+            edge_weights[:,~in_band[subimage[0]:subimage[2],subimage[1]:subimage[3]]] = np.inf
+            profiler.count("vertices", len(rows))
+            profiler.count("edges", int(np.count_nonzero(np.isfinite(edge_weights))))
+            
+            path = grid_search(edge_weights, level_start, level_end, subimage, search)
+    
+    return [(i+top, j+left) for i,j in path]
+
+# Search of the breast contour in polar coordinates around the center of the circle
+#    args:
+#        M - image of the gradient magnitude
+#        shape_prior - circle between the two points (see breast_contour)
+#        center, radius - center and radius of the circle
+#        pl,pr - initial and end point of the breast contour (opposite points of the circle)
+#        limits - rectangle [top, left, bottom, right] where the contour is searched
+#        radii - range of radii searched, relative to the radius of the circle
+# The gradient and the shape prior are resampled in a grid of angles (from pl to pr 
+# through the lower half of the circle) and radii, 1 pixel apart at most. The contour 
+# crosses each angle once, so it is found column by column with dynamic programming
+# (dists.polar_shortest_path) in O(angles x radii), and mapped back to the image as an
+# 8-connected path. Contours that turn back on themselves (seen from the center) can
+# not be found, in that case the result differs from the "exact" method.
+def polar_contour(M, shape_prior, center, radius, pl, pr, limits, radii=(0.5, 1.5)):
+    top, left, bottom, right = limits
+    inner = int(np.floor(radius*(1-radii[0])))
+    outer = int(np.floor(radius*(radii[1]-1)))
+    r = radius + np.arange(-inner, outer+1)
+    n_angles = int(np.ceil(np.pi*r[-1]))+1
+    first = np.arctan2(pl[0]-center[0], pl[1]-center[1])
+    theta, dtheta = np.linspace(first, first-np.pi, n_angles, retstep=True)
+    
+    with profiler.stage("resample"):
+        rows = (center[0]-top + np.outer(np.sin(theta), r)).astype(np.float32)
+        cols = (center[1]-left + np.outer(np.cos(theta), r)).astype(np.float32)
+        valid = (rows >= 0) & (rows <= bottom-top-1) & (cols >= 0) & (cols <= right-left-1)
+        M_polar = cv2.remap(M[top:bottom,left:right].astype(np.float32), cols, rows,
+                            cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        prior_polar = cv2.remap(shape_prior[top:bottom,left:right].astype(np.float32), cols, rows,
+                                cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    profiler.count("vertices", int(np.count_nonzero(valid)))
+    
+    with profiler.stage("shortest_path"):
+        path = dists.polar_shortest_path(M_polar, prior_polar, r, abs(dtheta), inner, inner, valid)
+    
+    # Back to image coordinates, the end points are kept exactly
+    points = np.rint(np.stack([center[0]+r[path]*np.sin(theta), 
+                               center[1]+r[path]*np.cos(theta)], axis=1)).astype(int)
+    points[0], points[-1] = pl, pr
+    return [tuple(p) for p in _connect(points)]
+
+# 8-connected path through the points (consecutive repeated points are removed)
+def _connect(points):
+    steps = np.abs(np.diff(points, axis=0)).max(axis=1)
+    keep = np.append(True, steps > 0)
+    points = points[keep]
+    differences = np.diff(points, axis=0)
+    steps = np.abs(differences).max(axis=1)
+    # Each segment is split in as many steps as its longest coordinate difference
+    segment = np.repeat(np.arange(len(steps)), steps)
+    t = np.arange(len(segment)) - np.repeat(np.cumsum(steps)-steps, steps)
+    inserted = points[segment] + np.rint(differences[segment]*(t/steps[segment])[:,None]).astype(int)
+    return np.concatenate([inserted, points[-1:]])
+
+# Halves an image, reducing each 2x2 block with "function" (the last row and column 
+# are repeated if the size is odd)
+def _halve(image, function):
+    h, w = image.shape
+    padded = np.pad(image, ((0,h%2),(0,w%2)), mode="edge")
+    return function(padded.reshape([(h+1)//2,2,(w+1)//2,2]), axis=(1,3))
     
 # Detects the nipple in the image.
 #    args:
@@ -189,47 +354,60 @@ def breast_contour(M, pl, pr, debug_verbose=True):
 #        debug_verbose - if true, results of intermediate steps are printed
 # First we assign to all pixels of the image the probability of being a nipple location 
 # We then select the maximum probability point as the nipple
+# The probability images have the floating point type config.dtype.
 def nipple(img, boundary, nipple_params, debug_verbose=True):
+    dtype = np.dtype(config.dtype)
     
     # Parameters computed during training:
-    means = nipple_params[0,:]
-    stds = nipple_params[1,:]
-    
-    #Compute the breast mask
-    breast_mask = get_breast_mask([*img.shape[0:2]],boundary)
+    means = nipple_params[0,:].astype(dtype)
+    stds = nipple_params[1,:].astype(dtype)
+    
+    # Compute the breast mask. All the probability images are zero outside the mask so
+    # they are only computed inside its bounding box, enlarged by one pixel so that the 
+    # distance transform still sees the background around the breast.
+    with profiler.stage("mask"):
+        contour = breast_spline(img.shape[0:2], boundary)
+        breast_mask, (top, left) = get_breast_mask_roi([*img.shape[0:2]], boundary, contour=contour, border=1)
+    profiler.count("pixels", breast_mask.size)
+    bottom, right = top+breast_mask.shape[0], left+breast_mask.shape[1]
+    img_crop = img[top:bottom,left:right]
     
     # Compute the probability image based on the angle
-    x,y = np.nonzero(breast_mask)
     mid_point = (boundary[0]+boundary[-1])/2
-    angle_image = np.zeros(breast_mask.shape)
-    for i in range(x.shape[0]):
-        vec = (x[i],y[i]) - mid_point
-        angle = np.arctan2(vec[0], vec[1])
-        
-        coords = (x[i].astype(int), y[i].astype(int))
-        angle_image[coords[0], coords[1]] = angle
+    x = (np.arange(top,bottom) - mid_point[0]).astype(dtype).reshape([-1,1])
+    y = (np.arange(left,right) - mid_point[1]).astype(dtype).reshape([1,-1])
+    angle_image = np.where(breast_mask, np.arctan2(x,y), dtype.type(0))
     angle_prob = dists.normal_prob(angle_image,means[0],stds[0])
         
     # Compute the probability image based on distance
-    distance_image = morpho.distance_transform_edt(breast_mask)
+    with profiler.stage("distance_transform"):
+        if dtype == np.float32:
+            # Same exact euclidean distance, computed in float32
+            distance_image = cv2.distanceTransform(breast_mask.astype(np.uint8), cv2.DIST_L2, 
+                                                   cv2.DIST_MASK_PRECISE)
+        else:
+            distance_image = morpho.distance_transform_edt(breast_mask)
     dist_prob = dists.normal_prob(distance_image,means[1],stds[1])
     
-    # Compute the probability image based on color
-    mean_color = np.asarray( [np.average(img[:,:,0],weights=breast_mask),
-                              np.average(img[:,:,1],weights=breast_mask),
-                              np.average(img[:,:,2],weights=breast_mask)
+    # Compute the probability image based on color (the three channels at once)
+    mean_color = np.asarray( [np.average(img_crop[:,:,0],weights=breast_mask),
+                              np.average(img_crop[:,:,1],weights=breast_mask),
+                              np.average(img_crop[:,:,2],weights=breast_mask)
                              ])
-    color_image = img-mean_color
-    red_prob = dists.normal_prob(color_image[:,:,0],means[2],stds[2])
-    blue_prob = dists.normal_prob(color_image[:,:,1],means[3],stds[3])
-    green_prob = dists.normal_prob(color_image[:,:,2],means[4],stds[4])
-    color_prob = (red_prob+blue_prob+green_prob)/3
+    color_image = img_crop-mean_color.astype(dtype)
+    channel_prob = dists.normal_prob(color_image,means[2:5],stds[2:5])
+    color_prob = (channel_prob[:,:,0]+channel_prob[:,:,1]+channel_prob[:,:,2])/3
     
     # Compute the final probability:
     prob = angle_prob*dist_prob*color_prob*breast_mask
     
     # Find the nipple position as the maximum of the probability image
     nip = np.unravel_index(np.argmax(prob),prob.shape)
+    if prob[nip] > 0:
+        nip = (nip[0]+top, nip[1]+left)
+    else:
+        # Same result as the argmax of the full image probability
+        nip = (0,0)
     
     if debug_verbose:
         plt.clf()
@@ -260,26 +438,13 @@ def nipple(img, boundary, nipple_params, debug_verbose=True):
 #        shape - image shape
 #        breast - points of the breast boundary
 #        debug_verbose - if true, results of intermediate steps are printed
-# 1. The points in the contour are set to 1
-# 2. The points in the line between the two extrema are set to 1
-# 3. The points in the black hole created by the first two operations are set to 1
-def get_breast_mask(shape, breast, debug_verbose=True):
-    # Fill all contour points
-    mask = np.zeros(shape)
-    x,y = dists.spline(breast,n_points=8000)
-    x = np.clip(np.round(x).astype(int),0,mask.shape[0]-1)
-    y = np.clip(np.round(y).astype(int),0,mask.shape[1]-1)
-    mask[x,y] = 1
-                
-    # Fill all points at the top
-    x = np.clip(np.linspace(breast[0,0],breast[-1,0],2000),0,mask.shape[0]-1)
-    y = np.clip(np.linspace(breast[0,1],breast[-1,1],2000),0,mask.shape[1]-1)
-    x = np.round(x).astype(int)
-    y = np.round(y).astype(int)
-    mask[x,y] = 1
-                
-    # Fill black holes of the mask
-    mask_full = morpho.binary_fill_holes(mask)
+#        contour - optional breast contour already computed with breast_spline
+# The polygon formed by the spline through the contour points, closed by the line 
+# between the two extrema, is filled. See get_breast_mask_roi.
+def get_breast_mask(shape, breast, debug_verbose=True, contour=None):
+    mask_roi, (top, left) = get_breast_mask_roi(shape, breast, contour=contour)
+    mask_full = np.zeros(shape, dtype=bool)
+    mask_full[top:top+mask_roi.shape[0], left:left+mask_roi.shape[1]] = mask_roi
     
     if debug_verbose:
         plt.clf()
@@ -288,42 +453,77 @@ def get_breast_mask(shape, breast, debug_verbose=True):
         
     return mask_full
 
+# Dense spline through the breast boundary points, as an array of (row, col)
+# coordinates clipped to the image. It can be computed once and passed to
+# get_breast_mask / get_breast_mask_roi by callers that also need the contour.
+def breast_spline(shape, breast, n_points=8000):
+    x,y = dists.spline(breast,n_points=n_points)
+    x = np.clip(np.round(x).astype(int),0,shape[0]-1)
+    y = np.clip(np.round(y).astype(int),0,shape[1]-1)
+    return np.stack([x,y],axis=1)
+
+# Mask of the breast restricted to the bounding box of its contour
+#    args:
+#        shape - image shape
+#        breast - points of the breast boundary
+#        contour - optional breast contour already computed with breast_spline
+#        border - number of pixels added around the bounding box (clipped to the image)
+# Returns the boolean mask of the bounding box and the (row, col) coordinates of
+# its top left corner in the image. The spline through the contour points is 
+# rasterized as a polygon whose last edge is the line between the two extrema, so
+# only the bounding box of the contour is ever touched.
+# The mask used to be the contour pixels and a line of rounded points between the
+# extrema, with binary_fill_holes over the whole image. The two masks are the same
+# for smooth contours like those of the pipeline, except for pixels within 1 px of
+# the line between the extrema, rasterized differently (up to a few tens of pixels
+# on noisy contours). They differ much more for contours that cross themselves
+# (fillPoly fills the loops, binary_fill_holes also the areas they enclose) or that
+# are clipped at the image border (holes open to the border are not filled by
+# binary_fill_holes).
+def get_breast_mask_roi(shape, breast, contour=None, border=0):
+    if contour is None:
+        contour = breast_spline(shape, breast)
+    
+    top = max(contour[:,0].min()-border, 0)
+    left = max(contour[:,1].min()-border, 0)
+    bottom = min(contour[:,0].max()+1+border, shape[0])
+    right = min(contour[:,1].max()+1+border, shape[1])
+    
+    mask = np.zeros([bottom-top, right-left], dtype=np.uint8)
+    polygon = np.flip(contour - [top, left], axis=1).astype(np.int32)
+    cv2.fillPoly(mask, [polygon], 1)
+    # Also draw the outline so that every contour pixel belongs to the mask
+    cv2.polylines(mask, [polygon], True, 1)
+    
+    return mask.astype(bool), (top, left)
+
 
-# Given a list of strong paths this function selects one point in each side of 
+# Given the strong paths this function selects one point in each side of 
 # the patient's body boundary near the breast lateral extrema points:
 #    args:
-#        final_segments - strong paths between the mid and bottom regions of the image
+#        final_segments - strong paths between the mid and bottom regions of the image,
+#                         an integer array with one path per row (or a list of paths)
 #        shape - image shape
 # 1. final paths which the top point is near the center of the image are discarded.
 # 2. from the remaining paths the two most central are selected. 
 def select_start_points(final_segments,shape):
     
-    valid_L_js = []
-    valid_R_js = []
-    
-    L_distances = []
-    R_distances = []
+    # Column of each path in the middle row of the image (its last point)
+    final_segments = np.asarray(final_segments, dtype=int)
+    js = final_segments[:,-1] if len(final_segments) else np.zeros(0, dtype=int)
     
     img_len = shape[1]
     half_img_len = img_len/2
-    
-    for segment in final_segments:
-        j = segment[-1]
-        if (np.abs(j-half_img_len)/img_len)>0.2:
-            
-            dist = (np.abs(j-half_img_len)/img_len)
-            
-            if (j-half_img_len)<0:
-                valid_L_js.append(j)
-                L_distances.append(dist)
-            else:
-                valid_R_js.append(j)
-                R_distances.append(dist)
-
-    left = [x for _, x in sorted(zip(L_distances, valid_L_js))]
-    right = [x for _, x in sorted(zip(R_distances, valid_R_js))]
+    distances = np.abs(js-half_img_len)/img_len
+    valid = distances>0.2
+    
+    # The most central path of each side (the smallest column among equally central ones)
+    left_js, L_distances = js[valid & (js<half_img_len)], distances[valid & (js<half_img_len)]
+    right_js, R_distances = js[valid & (js>=half_img_len)], distances[valid & (js>=half_img_len)]
+    left = left_js[np.lexsort((left_js, L_distances))]
+    right = right_js[np.lexsort((right_js, R_distances))]
 
-    return left[0], right[0]
+    return int(left[0]), int(right[0])
     
 # Given a starting point and a weighted image this funtion travels upwards in
 # the direction of maximum intensity until the end conditions are met.
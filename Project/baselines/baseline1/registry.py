@@ -0,0 +1,97 @@
+# This file is part of baseline1 of the VISUM challenge
+#
+# In-process cache of the models created during training. The models of a folder
+# are read from disk once, by load (e.g. once per worker process) or the first time
+# get_models needs them, and read again only if the modification time of one of the
+# files changed. load always checks the modification times; get_models checks them
+# at most once every CHECK_INTERVAL seconds, so it is cheap enough to be called for
+# every image.
+# The arrays returned are read-only, so they can be shared by every caller (and
+# thread) of the process.
+
+# Outside Imports
+import os
+import time
+import threading
+import numpy as np
+
+# Files saved by train.ipynb in the models folder
+MODEL_NAMES = ["left_nipple_params", "right_nipple_params", "mean_model"]
+
+# Minimum number of seconds between two checks of the modification times in get_models
+CHECK_INTERVAL = 5.0
+
+_lock = threading.Lock()
+_cache = {}  # models folder -> [modification times, dictionary of models, time of the last check]
+_default_dir = "models"  # folder of the last call to load
+
+
+def _modification_times(models_dir):
+    return tuple(os.stat(os.path.join(models_dir, name + ".npy")).st_mtime_ns
+                 for name in MODEL_NAMES)
+
+
+def _read(key):
+    # Called with _lock held
+    mtimes = _modification_times(key)
+    models = {}
+    for name in MODEL_NAMES:
+        array = np.load(os.path.join(key, name + ".npy"))
+        array.setflags(write=False)
+        models[name] = array
+    _cache[key] = [mtimes, models, time.monotonic()]
+    return models
+
+
+def _get(key, interval):
+    # Called with _lock held. The modification times are checked if the last check
+    # is at least interval seconds old.
+    cached = _cache.get(key)
+    if cached is None:
+        return _read(key)
+    now = time.monotonic()
+    if now - cached[2] >= interval:
+        if _modification_times(key) != cached[0]:
+            return _read(key)
+        cached[2] = now
+    return cached[1]
+
+
+def load(models_dir=None):
+    """
+    Reads the models in models_dir (the last folder loaded if None) unless they
+    are already cached and did not change since, and makes models_dir the
+    default folder of get_models. Returns the dictionary of models.
+    """
+    global _default_dir
+    with _lock:
+        if models_dir is not None:
+            _default_dir = models_dir
+        return _get(os.path.abspath(_default_dir), 0)
+
+
+def get_models(models_dir=None):
+    """
+    Returns a dictionary with the models in models_dir (the last folder loaded
+    if None, see MODEL_NAMES) as read-only numpy arrays. The files are read if
+    the models were not loaded before or, at most CHECK_INTERVAL seconds after
+    the last check of their modification times, if they changed.
+    """
+    with _lock:
+        key = os.path.abspath(_default_dir if models_dir is None else models_dir)
+        return _get(key, CHECK_INTERVAL)
+
+
+def get_model(name, models_dir=None):
+    """
+    Returns a single model (see get_models).
+    """
+    return get_models(models_dir)[name]
+
+
+def clear():
+    """
+    Removes all models from the cache.
+    """
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,117 @@
+import os
+import json
+import numpy as np
+
+MANIFEST = "manifest.json"
+
+
+def split_indices(n, test_size=0.2, random_state=42):
+    """
+    Indices of the train and validation sets. Same split as
+    sklearn.model_selection.train_test_split(..., test_size, random_state)
+    used by the notebooks.
+    """
+    n_test = int(np.ceil(test_size * n))
+    permutation = np.random.RandomState(random_state).permutation(n)
+    return permutation[n_test:], permutation[:n_test]
+
+
+def write_dataset(directory, arrays, test_size=0.2, random_state=42):
+    """
+    Write a dataset for memory-mapped access.
+
+    Arguments
+    ---------
+    directory: folder where the dataset is written.
+    arrays: dictionary {name: array}, all with the same number of images (first axis).
+    test_size, random_state: train/validation split (see split_indices).
+
+    Each array is saved as <name>.npy, with the images reordered so that the
+    train and validation sets are contiguous blocks. The original index of each
+    image is saved as "order". manifest.json keeps the shape and dtype of each
+    array and the [start, end) range of each split.
+    Returns the opened Dataset.
+    """
+    n = len(next(iter(arrays.values())))
+    train, validation = split_indices(n, test_size, random_state)
+    order = np.concatenate([train, validation])
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    manifest = {"size": n,
+                "splits": {"train": [0, len(train)], "validation": [len(train), n]},
+                "arrays": {}}
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    dataset = Dataset(directory)
+    dataset.add("order", order)
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        assert len(array) == n, "%s has %d images, expected %d" % (name, len(array), n)
+        dataset.add(name, array[order])
+    return dataset
+
+
+def open_dataset(directory, mmap_mode="r"):
+    return Dataset(directory, mmap_mode=mmap_mode)
+
+
+class Dataset(object):
+    def __init__(self, directory, mmap_mode="r"):
+        """
+        Dataset written by write_dataset. Arrays are opened with np.load(mmap_mode=...)
+        so only the images that are accessed are read from disk.
+        """
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(directory, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self._arrays = {}
+
+    def __len__(self):
+        return self.manifest["size"]
+
+    def __contains__(self, name):
+        return name in self.manifest["arrays"]
+
+    def __getitem__(self, name):
+        """Memory-mapped array"""
+        if name not in self._arrays:
+            info = self.manifest["arrays"][name]
+            self._arrays[name] = np.load(os.path.join(self.directory, info["file"]),
+                                         mmap_mode=self.mmap_mode)
+        return self._arrays[name]
+
+    def names(self):
+        return list(self.manifest["arrays"])
+
+    def split(self, split, name):
+        """Memory-mapped view of the images of an array in a split ("train" or "validation")"""
+        start, end = self.manifest["splits"][split]
+        return self[name][start:end]
+
+    def add(self, name, array):
+        """Save a new array, in the order of the dataset"""
+        array = np.asarray(array)
+        np.save(os.path.join(self.directory, name + ".npy"), array)
+        self._register(name, array.shape, array.dtype)
+
+    def create(self, name, shape, dtype=np.float32):
+        """
+        Create a new array on disk and return it as a writable memory map, e.g.
+        to render heatmaps directly into it.
+        """
+        path = os.path.join(self.directory, name + ".npy")
+        array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape))
+        self._register(name, array.shape, array.dtype)
+        self._arrays[name] = array
+        return array
+
+    def _register(self, name, shape, dtype):
+        self.manifest["arrays"][name] = {"file": name + ".npy",
+                                         "shape": list(shape),
+                                         "dtype": np.dtype(dtype).str}
+        self._arrays.pop(name, None)
+        with open(os.path.join(self.directory, MANIFEST), "w") as f:
+            json.dump(self.manifest, f, indent=1)
@@ -0,0 +1,216 @@
+"""
+Keypoints from the heatmaps predicted by the U-Net (stage1 in 3_train).
+
+The heatmap has a single channel, so it does not say which keypoint each peak
+belongs to. The keypoints predicted by the dense head are used to identify
+them: the sternal notch and the nipples are moved to the closest peak of the
+heatmap and each point of the breast contours is moved to the ridge of the
+heatmap along the normal of the contour. Everything is computed with NumPy on
+the whole batch, the network is not evaluated again.
+
+Keypoints are [N, 74] arrays in pixels of the resized image (the output of the
+dense head multiplied by 512), alternating x (column) and y (row).
+"""
+import numpy as np
+from scipy import ndimage
+
+# Keypoints (index of the (x, y) pair) of each structure
+LEFT_CONTOUR = np.arange(0, 17)
+RIGHT_CONTOUR = np.arange(17, 34)
+POINTS = np.array([34, 35, 36])  # sternal notch, left nipple, right nipple
+
+
+def _squeeze(heatmaps):
+    heatmaps = np.asarray(heatmaps, dtype=np.float32)
+    if heatmaps.ndim == 4:
+        heatmaps = heatmaps[..., 0]
+    return heatmaps
+
+
+def find_peaks(heatmaps, threshold=0.5, window=15, max_area=None):
+    """
+    Local maxima of a batch of heatmaps ([N, rows, columns] or [N, rows, columns, 1]):
+    pixels above threshold that are the maximum of the window x window
+    neighbourhood around them (non-maximum suppression).
+
+    Heatmaps are clamped to the peak of a gaussian (see heatmaps.render), so 
+    nearby keypoints (e.g. those of a breast contour) merge into a flat region.
+    Each connected set of equal maxima gives a single peak, its pixel closest 
+    to the centroid. If max_area is given, only the peaks of regions above 
+    threshold of at most max_area pixels are kept (isolated keypoints).
+    Returns the arrays (image, row, column) of the peaks, for the whole batch.
+    """
+    heatmaps = _squeeze(heatmaps)
+    maxima = ndimage.maximum_filter(heatmaps, size=(1, window, window), mode='constant')
+    is_peak = (heatmaps == maxima) & (heatmaps > threshold)
+
+    # 8-connected regions of each image (images are not connected to each other)
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = True
+    if max_area is not None:
+        regions, n_regions = ndimage.label(heatmaps > threshold, structure=structure)
+        area = np.bincount(regions.ravel(), minlength=n_regions + 1)
+        is_peak &= area[regions] <= max_area
+
+    labels, n_peaks = ndimage.label(is_peak, structure=structure)
+    if n_peaks == 0:
+        return tuple(np.zeros(0, dtype=int) for _ in range(3))
+    image, r, c = np.nonzero(labels)
+    label = labels[image, r, c] - 1
+    counts = np.bincount(label, minlength=n_peaks)
+    centroid_r = np.bincount(label, r, minlength=n_peaks) / counts
+    centroid_c = np.bincount(label, c, minlength=n_peaks) / counts
+    # pixel of each region closest to its centroid
+    distance = (r - centroid_r[label]) ** 2 + (c - centroid_c[label]) ** 2
+    order = np.lexsort((distance, label))
+    _, first = np.unique(label[order], return_index=True)
+    closest = order[first]
+    return image[closest], r[closest], c[closest]
+
+
+def refine_peaks(heatmaps, peaks, method='quadratic', radius=2, beta=20.0):
+    """
+    Sub-pixel position (x, y) of the peaks given by find_peaks, as a [P, 2] array.
+
+    method: 'quadratic' fits a parabola through each peak and its two
+        neighbours, in each direction. 'soft_argmax' is the mean position in the
+        (2 radius + 1)^2 window around the peak, weighted by softmax(beta * heatmap).
+    """
+    heatmaps = _squeeze(heatmaps)
+    n, rows, cols = heatmaps.shape
+    image, r, c = [np.asarray(p) for p in peaks]
+
+    if method == 'quadratic':
+        def offset(before, center, after):
+            curvature = before - 2 * center + after
+            with np.errstate(divide='ignore', invalid='ignore'):
+                d = np.where(curvature < 0, 0.5 * (before - after) / curvature, 0)
+            return np.clip(d, -0.5, 0.5)
+        left = heatmaps[image, r, np.maximum(c - 1, 0)]
+        right = heatmaps[image, r, np.minimum(c + 1, cols - 1)]
+        up = heatmaps[image, np.maximum(r - 1, 0), c]
+        down = heatmaps[image, np.minimum(r + 1, rows - 1), c]
+        center = heatmaps[image, r, c]
+        return np.stack([c + offset(left, center, right), r + offset(up, center, down)], axis=1)
+
+    if method == 'soft_argmax':
+        d = np.arange(-radius, radius + 1)
+        wr = np.clip(r[:, None, None] + d[None, :, None], 0, rows - 1)
+        wc = np.clip(c[:, None, None] + d[None, None, :], 0, cols - 1)
+        values = heatmaps[image[:, None, None], wr, wc]
+        weights = np.exp(beta * (values - values.max(axis=(1, 2), keepdims=True)))
+        weights /= weights.sum(axis=(1, 2), keepdims=True)
+        return np.stack([(weights * wc).sum(axis=(1, 2)), (weights * wr).sum(axis=(1, 2))], axis=1)
+
+    raise ValueError("Unknown method %s" % method)
+
+
+def match_points(keypoints, peaks, positions, max_distance=40):
+    """
+    Position of the sternal notch and the nipples (see POINTS) in the heatmap.
+    Each of them is assigned the closest peak (positions [P, 2] of the peaks
+    found in each image, peaks[0]) closer than max_distance pixels to the
+    keypoint of the dense head. Returns the positions [N, 3, 2] and a [N, 3]
+    mask of the keypoints that were found.
+    """
+    keypoints = np.asarray(keypoints, dtype=float).reshape([len(keypoints), -1, 2])
+    n = len(keypoints)
+    found = np.zeros((n, len(POINTS)), dtype=bool)
+    matched = keypoints[:, POINTS].copy()
+    if len(positions) == 0:
+        return matched, found
+
+    image = np.asarray(peaks[0])
+    # Distance of every keypoint to every peak of its image [P, 3]
+    distances = np.linalg.norm(positions[:, None, :] - keypoints[image][:, POINTS], axis=2)
+    for k in range(len(POINTS)):
+        d = np.where(distances[:, k] <= max_distance, distances[:, k], np.inf)
+        best = np.full(n, np.inf)
+        np.minimum.at(best, image, d)
+        candidates = np.flatnonzero(np.isfinite(d) & (d == best[image]))
+        # peaks are sorted by image, keep the first closest peak of each image
+        _, first = np.unique(image[candidates], return_index=True)
+        rows = candidates[first]
+        matched[image[rows], k] = positions[rows]
+        found[image[rows], k] = True
+    return matched, found
+
+
+def contour_normals(contours):
+    """Unit normals [N, M, 2] of polylines [N, M, 2] (central differences)"""
+    tangents = np.gradient(contours, axis=1)
+    normals = np.stack([-tangents[..., 1], tangents[..., 0]], axis=-1)
+    norm = np.linalg.norm(normals, axis=-1, keepdims=True)
+    return normals / np.maximum(norm, 1e-12)
+
+
+def ridge_contours(heatmaps, contours, search=20, step=1.0, threshold=0.3, max_flat=4):
+    """
+    Move the points of the contours ([N, M, 2], x and y) to the ridge of the
+    heatmap. The heatmap is sampled along the normal of the contour at each
+    point, +-search pixels every step pixels, and the point is moved to the
+    maximum of the profile, refined with a parabola. Points where the maximum
+    is below threshold, or flat over more than max_flat pixels, are not moved.
+    Returns the contours and a [N, M] mask of the points that were moved.
+    """
+    heatmaps = _squeeze(heatmaps)
+    n = len(contours)
+    normals = contour_normals(contours)
+    offsets = np.arange(-search, search + step / 2, step)
+    # Samples [N, M, S, 2]
+    samples = contours[:, :, None, :] + offsets[None, None, :, None] * normals[:, :, None, :]
+    image = np.broadcast_to(np.arange(n)[:, None, None], samples.shape[:3])
+    profiles = ndimage.map_coordinates(heatmaps, [image.ravel(), samples[..., 1].ravel(),
+                                                  samples[..., 0].ravel()],
+                                       order=1, mode='nearest').reshape(samples.shape[:3])
+
+    # The ridge can be flat where the heatmap is clamped. The point is moved 
+    # to the middle of the run of samples at the maximum closest to it, or not
+    # moved if the run is wider than max_flat pixels (the heatmap does not 
+    # locate the contour there). A single maximum is refined with a parabola.
+    peak = profiles.max(axis=2)
+    at_peak = profiles >= peak[..., None] - 1e-6
+    index = np.arange(len(offsets))
+    center = np.where(at_peak, np.abs(offsets), np.inf).argmin(axis=2)[..., None]
+    first = np.where(~at_peak & (index < center), index + 1, 0).max(axis=2)
+    last = np.where(~at_peak & (index > center), index - 1, len(offsets) - 1).min(axis=2)
+    before = np.take_along_axis(profiles, np.maximum(first - 1, 0)[..., None], axis=2)[..., 0]
+    after = np.take_along_axis(profiles, np.minimum(last + 1, len(offsets) - 1)[..., None], axis=2)[..., 0]
+    curvature = before - 2 * peak + after
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sub = np.where((first == last) & (curvature < 0), 0.5 * (before - after) / curvature, 0)
+    shift = (offsets[first] + offsets[last]) / 2 + np.clip(sub, -0.5, 0.5) * step
+
+    moved = (peak > threshold) & (offsets[last] - offsets[first] <= max_flat)
+    refined = contours + np.where(moved[..., None], shift[..., None] * normals, 0)
+    return refined, moved
+
+
+def decode(heatmaps, keypoints, blend=1.0, peak_threshold=0.5, window=15, max_area=2500,
+           method='quadratic', max_distance=40, search=20, ridge_threshold=0.3):
+    """
+    Keypoints [N, 74] of the batch from the heatmaps and the keypoints of the
+    dense head (both in pixels of the resized image).
+
+    blend: weight of the heatmap keypoints, 1 replaces the dense keypoints with
+        them and 0 returns the dense keypoints. Keypoints not found in the
+        heatmap keep the dense value.
+    The other arguments are those of find_peaks, refine_peaks, match_points and
+    ridge_contours.
+    """
+    keypoints = np.asarray(keypoints, dtype=float)
+    points = keypoints.reshape([len(keypoints), -1, 2])
+    decoded = points.copy()
+
+    peaks = find_peaks(heatmaps, threshold=peak_threshold, window=window, max_area=max_area)
+    positions = refine_peaks(heatmaps, peaks, method=method)
+    matched, found = match_points(keypoints, peaks, positions, max_distance=max_distance)
+    decoded[:, POINTS] = np.where(found[..., None], matched, points[:, POINTS])
+
+    for contour in (LEFT_CONTOUR, RIGHT_CONTOUR):
+        refined, _ = ridge_contours(heatmaps, points[:, contour], search=search,
+                                    threshold=ridge_threshold)
+        decoded[:, contour] = refined
+
+    decoded = blend * decoded + (1 - blend) * points
+    return decoded.reshape(keypoints.shape)
@@ -1,8 +1,10 @@
+import copy
 import math
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
 from skimage.transform import rotate as rotate_
+from baseline2 import heatmaps
 
 def translate_points(point,translation): 
     point = point + translation 
@@ -36,11 +38,22 @@ class Generator(object):
                  contrast_ratio=0.1,
                  flip_indices=[(0,34),(1,35),(2,36),(3,37),(4,38),(5,39),(6,40),(7,41),(8,42),(9,43),(10,44),(11,45),(12,46),(13,47),(14,48),(15,49),(16,50),(17,51)
                 ,(18,52),(19,53),(20,54),(21,55),(22,56),(23,57),(24,58),(25,59),(26,60),(27,61),(28,62),(29,63),(30,64),(31,65)
-                ,(32,66),(33,67),(68,68),(69,69),(70,72),(71,73)]
+                ,(32,66),(33,67),(68,68),(69,69),(70,72),(71,73)],
+                 heatmap_sigma=20,
+                 preprocess=None
                  ):
         """
         Arguments
         ---------
+        Mask_train: heatmaps of the training images. If None the heatmap of
+            each batch is rendered from its augmented keypoints (see
+            heatmaps.render_stamps), which keeps it consistent with the 
+            augmentation and avoids loading the precomputed heatmaps.
+        heatmap_sigma: standard deviation, in pixels, of the rendered heatmaps.
+        preprocess: function applied to each batch of images, converted to 
+            float32, before the augmentation (e.g. vgg16.preprocess_input). It
+            allows X_train to be a memory-mapped uint8 array (see dataset.py),
+            so only the images of each batch are read and converted.
         """
         self.X_train = X_train
         self.Mask_train = Mask_train
@@ -52,100 +65,113 @@ class Generator(object):
         self.rotate_ratio = rotate_ratio
         self.contrast_ratio = contrast_ratio
         self.flip_indices = flip_indices
+        self.flip_permutation = np.arange(74)
+        for a, b in flip_indices:
+            self.flip_permutation[a], self.flip_permutation[b] = b, a
+        self.heatmap_sigma = heatmap_sigma
+        self.render_heatmaps = Mask_train is None
+        self.preprocess = preprocess
+        # Source of the random augmentations. make_batch replaces it by the
+        # RandomState of each batch.
+        self.rng = np.random
 
     
 
     def _random_indices(self, ratio):
         """Generate random unique indices according to ratio"""
         size = int(self.actual_batchsize * ratio)
-        return np.random.choice(self.actual_batchsize, size, replace=False)
+        return self.rng.choice(self.actual_batchsize, size, replace=False)
     
     def flip(self):
         """Flip image batch"""
         indices = self._random_indices(self.flip_ratio)
         self.inputs[indices] = self.inputs[indices,:,::-1,:]
-        self.mask[indices] = self.mask[indices, :, ::-1]
+        if not self.render_heatmaps:
+            self.mask[indices] = self.mask[indices, :, ::-1]
         self.targets[indices, ::2] = 1 - self.targets[indices, ::2]
-        for a, b in self.flip_indices:
-            self.targets[indices, a], self.targets[indices, b] = (self.targets[indices, b], self.targets[indices, a])      
+        # Swap the left and right keypoints with a single gather
+        self.targets[indices] = self.targets[indices][:, self.flip_permutation]
             
+    def warp(self, indices, matrices):
+        """
+        Apply an affine transformation to the images, masks and targets of the
+        samples in indices. matrices has shape [len(indices), 2, 3] and maps 
+        pixel coordinates, as in cv2.warpAffine.
+        """
+        rows, cols = self.inputs.shape[1:3]
+        for i, M in zip(indices, matrices):
+            # All the channels are warped in a single call
+            self.inputs[i] = cv2.warpAffine(self.inputs[i], M, (cols, rows))
+            if not self.render_heatmaps:
+                self.mask[i,:,:,0] = cv2.warpAffine(self.mask[i,:,:,0], M, (cols, rows))
+        
+        # targets are normalized by the width of the image
+        keypoints = self.targets[indices].reshape([-1,37,2]) * cols
+        keypoints = np.matmul(keypoints, matrices[:,:,0:2].transpose(0,2,1)) + matrices[:,np.newaxis,:,2]
+        self.targets[indices] = keypoints.reshape([-1,74]) / cols
             
     def translation(self): 
         """Translation"""
-        x_t = [] 
-        y_t = [] 
-        
         indices = self._random_indices(self.translation_ratio)
-        tx = np.random.randint(-50, 50)
-        ty = np.random.randint(-30, 30)
+        tx = self.rng.randint(-50, 50)
+        ty = self.rng.randint(-30, 30)
         
-        x_t = self.targets[indices, ::2]
-        y_t = self.targets[indices, 1::2]
-        
-        for i in range(np.shape(x_t)[0]):
-            x_t[i] = translate_points(x_t[i],tx/512)
-            y_t[i] = translate_points(y_t[i],ty/512)
-            
-            
-        self.targets[indices, ::2] = x_t
-        self.targets[indices, 1::2] = y_t 
-        
-        
-        mask = self.mask[indices,:,:]
-        image = self.inputs[indices,:,:,:]
-        
-        
-        for i in range(np.shape(mask)[0]): 
-             mask[i,:,:,0] = cv2.warpAffine(mask[i,:,:,0],np.float32([[1,0,tx],[0,1,ty]]),(512,384))
-             
-             
-        mask = np.reshape(mask,(-1,384,512))
-        
-             
-        for i in range(np.shape(image)[0]):
-            for j in range(3):
-                image[i,:,:,j] = cv2.warpAffine(image[i,:,:,j],np.float32([[1,0,tx],[0,1,ty]]),(512,384))
-            
-        
-        mask = np.reshape(mask,(-1,384,512,1))
-
-        self.mask[indices] = mask[:]
-        self.inputs[indices,:,:,:] = image[:,:,:,:]
-
+        matrices = np.tile(np.float32([[1,0,tx],[0,1,ty]]), (len(indices),1,1))
+        self.warp(indices, matrices)
 
     def rotate(self):
         """Rotate slighly the image and the targets."""
         indices = self._random_indices(self.rotate_ratio)
-        angle = np.random.randint(-10, 10)
+        angle = self.rng.randint(-10, 10)
 
-        M = cv2.getRotationMatrix2D((512/2,384/2),angle,1)
-        for i in indices: 
-            for j in range(3): 
-                self.inputs[i,:,:,j] = cv2.warpAffine(self.inputs[i,:,:,j],M,(512,384))
-            self.mask[i,:,:,0] = cv2.warpAffine(self.mask[i,:,:,0],M,(512,384))
-            
-        x_r = []
-        y_r = [] 
-               
-        for i in range(np.shape(self.mask)[0]): 
-            x_r.append(self.targets[i][0:74:2])
-            y_r.append(self.targets[i][1:75:2])
-            x_r[i], y_r[i] = rotate_points((256/512,192/512),(x_r[i],y_r[i]),(-angle * 2 * np.pi)/360)
-            self.targets[i][0:74:2] = x_r[i] 
-            self.targets[i][1:75:2] = y_r[i]
+        rows, cols = self.inputs.shape[1:3]
+        M = cv2.getRotationMatrix2D((cols/2,rows/2),angle,1)
+        matrices = np.tile(M, (len(indices),1,1))
+        self.warp(indices, matrices)
             
 
+    def render_mask(self):
+        """Render the heatmaps of the batch from the (augmented) targets"""
+        rows, cols = self.inputs.shape[1:3]
+        # targets are normalized by the width of the image
+        keypoints = self.targets.reshape([-1,37,2]) * cols
+        mask = heatmaps.render_stamps(keypoints, shape=(rows,cols), sigma=self.heatmap_sigma)
+        self.mask = mask.reshape([-1,rows,cols,1])
+
+    def _build_batch(self, items):
+        """
+        Load and augment the samples items (a slice or an array of indices) 
+        into self.inputs, self.mask and self.targets.
+        """
+        if self.preprocess is None:
+            self.inputs = np.array(self.X_train[items])
+        else:
+            self.inputs = self.preprocess(np.array(self.X_train[items], dtype=np.float32))
+        if not self.render_heatmaps:
+            self.mask = np.array(self.Mask_train[items])
+        self.targets = np.array(self.Y_train[items])
+        self.actual_batchsize = self.inputs.shape[0]  # Need this to avoid indices out of bounds
+        self.flip()
+        self.translation()
+        if self.render_heatmaps:
+            self.render_mask()
+
+        return (self.inputs, {'heatmaps': self.mask, 'keypoints': self.targets})
+
+    def make_batch(self, items, rng=None):
+        """
+        Augmented batch of the samples items (a slice or an array of indices),
+        drawing the augmentations from rng (a np.random.RandomState).
+        The batch is built in a shallow copy of the generator, so several 
+        batches can be prepared at the same time (see pipeline.py).
+        """
+        state = copy.copy(self)
+        state.rng = np.random if rng is None else rng
+        return state._build_batch(items)
+
     def generate(self, batchsize=32): 
         """Generator"""
         while True:
             cuts = [(b, min(b + self.batchsize, self.size_train)) for b in range(0, self.size_train, self.batchsize)]
             for start, end in cuts:
-                self.inputs = self.X_train[start:end].copy()
-                self.mask = self.Mask_train[start:end].copy()
-                self.targets = self.Y_train[start:end].copy()
-                self.actual_batchsize = self.inputs.shape[0]  # Need this to avoid indices out of bounds
-                self.flip()
-                self.translation()
-
-                yield (self.inputs, {'heatmaps': self.mask, 'keypoints': self.targets})
-    
\ No newline at end of file
+                yield self._build_batch(slice(start, end))
@@ -0,0 +1,135 @@
+import math
+import functools
+import numpy as np
+
+
+def gaussian_1d(coords, mu, sigma):
+    """Unnormalized 1D gaussian exp(-(coords-mu)^2 / (2 sigma^2))"""
+    return np.exp(-0.5 * (coords - mu) ** 2 / sigma ** 2)
+
+
+def render(keypoints, shape=(384, 512), sigma=20, truncate=3.0, out=None, dtype=np.float32):
+    """
+    Heatmap of the keypoints of one image, the ground truth of the U-Net in 3_train.
+
+    Arguments
+    ---------
+    keypoints: array with the (x, y) = (column, row) coordinates of the keypoints,
+        with shape [37, 2] (or the 74 values of a prediction).
+    shape: (rows, columns) of the heatmap.
+    sigma: standard deviation of the gaussians, in pixels. get_pdf in
+        2_heatmap_generation received its square (400).
+    truncate: the gaussians are only computed in a window of +-truncate*sigma
+        around each keypoint. None computes them in the whole image.
+    out: optional preallocated array with the given shape where the heatmap is written.
+
+    The result is the same as get_pdf: the gaussians of the keypoints are added
+    one by one and, after each addition, the map is clamped to the maximum of
+    the last gaussian. Finally it is normalized to [0, 1]. Each gaussian is the
+    outer product of two 1D gaussians. With truncate=None the map matches
+    get_pdf to floating point precision. Values beyond the window are ignored,
+    each of them is below exp(-4.5) (about 1%) of the peak for truncate=3, so the
+    normalized map differs from get_pdf by a few hundredths where tails overlap.
+    get_pdf truncated the keypoint coordinates to integers before calling it,
+    here they are used as given.
+    """
+    rows, cols = shape
+    keypoints = np.asarray(keypoints, dtype=float).reshape([-1, 2])
+    if out is None:
+        out = np.zeros(shape, dtype=dtype)
+    else:
+        out[:] = 0
+
+    # Accumulation is done in float64, as in get_pdf
+    heatmap = np.zeros(shape)
+    scale = 1 / (2 * math.pi * sigma ** 2)
+    row_coords = np.arange(rows, dtype=float)
+    col_coords = np.arange(cols, dtype=float)
+    radius = None if truncate is None else truncate * sigma
+
+    previous_maximum = None
+    for x, y in keypoints:
+        g_row = gaussian_1d(row_coords, y, sigma)
+        g_col = gaussian_1d(col_coords, x, sigma)
+        maximum = scale * g_row.max() * g_col.max()
+
+        if radius is None:
+            r0, r1, c0, c1 = 0, rows, 0, cols
+        else:
+            r0, r1 = max(int(math.floor(y - radius)), 0), min(int(math.ceil(y + radius)) + 1, rows)
+            c0, c1 = max(int(math.floor(x - radius)), 0), min(int(math.ceil(x + radius)) + 1, cols)
+
+        if r0 < r1 and c0 < c1:
+            window = heatmap[r0:r1, c0:c1]
+            window += scale * np.outer(g_row[r0:r1], g_col[c0:c1])
+            np.minimum(window, maximum, out=window)
+
+        # Outside the window the map is already below the previous maximum, it
+        # only has to be clamped again if this maximum is smaller.
+        if radius is not None and previous_maximum is not None and maximum < previous_maximum:
+            np.minimum(heatmap, maximum, out=heatmap)
+        previous_maximum = maximum
+
+    heatmap -= heatmap.min()
+    peak = heatmap.max()
+    if peak > 0:
+        heatmap /= peak
+    out[:] = heatmap
+    return out
+
+
+def render_batch(keypoints, shape=(384, 512), sigma=20, truncate=3.0, out=None, dtype=np.float32):
+    """
+    Heatmaps of a set of images (see render). keypoints is an array with shape
+    [N, 37, 2] or [N, 74]. The heatmaps are written in out, a preallocated
+    array with shape [N, rows, columns], or in a new array of the given dtype.
+    """
+    keypoints = np.asarray(keypoints, dtype=float).reshape([len(keypoints), -1, 2])
+    if out is None:
+        out = np.empty((len(keypoints),) + tuple(shape), dtype=dtype)
+    for i in range(len(keypoints)):
+        render(keypoints[i], shape=shape, sigma=sigma, truncate=truncate, out=out[i])
+    return out
+
+
+@functools.lru_cache(maxsize=None)
+def gaussian_stamp(sigma=20, truncate=3.0):
+    """
+    Gaussian with peak 1 sampled in a [2r+1, 2r+1] window, r = ceil(truncate*sigma).
+    It is computed once for each (sigma, truncate) and returned read-only.
+    """
+    radius = int(math.ceil(truncate * sigma))
+    g = gaussian_1d(np.arange(-radius, radius + 1, dtype=float), 0, sigma)
+    stamp = np.outer(g, g)
+    stamp.setflags(write=False)
+    return stamp
+
+
+def render_stamps(keypoints, shape=(384, 512), sigma=20, truncate=3.0, out=None, dtype=np.float32):
+    """
+    Fast approximation of render_batch used to build training targets on the fly.
+    keypoints is an array with shape [N, 37, 2] or [N, 74] in pixels. Each
+    keypoint is rounded to the nearest pixel and the cached gaussian_stamp is
+    added around it, so the cost per keypoint is bounded by the stamp size.
+    As in render, the map is clamped to the peak of a gaussian (1), which is
+    also the normalization render applies when the keypoints are inside the image.
+    """
+    keypoints = np.asarray(keypoints, dtype=float).reshape([len(keypoints), -1, 2])
+    rows, cols = shape
+    if out is None:
+        out = np.zeros((len(keypoints), rows, cols), dtype=dtype)
+    else:
+        out[:] = 0
+
+    stamp = gaussian_stamp(sigma, truncate)
+    radius = stamp.shape[0] // 2
+    centers = np.round(keypoints).astype(int)
+    for i in range(len(keypoints)):
+        for x, y in centers[i]:
+            r0, r1 = max(y - radius, 0), min(y + radius + 1, rows)
+            c0, c1 = max(x - radius, 0), min(x + radius + 1, cols)
+            if r0 < r1 and c0 < c1:
+                out[i, r0:r1, c0:c1] += stamp[r0 - y + radius:r1 - y + radius,
+                                              c0 - x + radius:c1 - x + radius]
+    np.minimum(out, 1, out=out)
+    return out
@@ -0,0 +1,129 @@
+"""
+Parallel input pipeline for the training of baseline2.
+
+BatchSequence gives random access to the augmented batches of a Generator:
+every batch is built from its own RandomState, seeded with (seed, epoch, batch
+index), and without shared state, so any number of batches can be prepared at
+the same time and the result does not depend on which worker prepared them.
+It can be given to model.fit_generator(..., workers=n) as a keras Sequence, or
+iterated with prefetch, which prepares the next batches in a pool of threads
+while the model trains on the current one.
+"""
+import math
+import queue
+import threading
+import numpy as np
+
+try:
+    from keras.utils import Sequence
+except ImportError:
+    Sequence = object
+
+
+class BatchSequence(Sequence):
+    def __init__(self, generator, seed=0, shuffle=True):
+        """
+        Arguments
+        ---------
+        generator: Generator with the training data and the augmentation settings.
+        seed: seed of the augmentations and of the order of the samples.
+        shuffle: if True the samples are assigned to the batches in a different
+            random order in each epoch.
+        """
+        self.generator = generator
+        self.seed = seed
+        self.shuffle = shuffle
+        self.epoch = 0
+
+    def __len__(self):
+        return int(math.ceil(self.generator.size_train / self.generator.batchsize))
+
+    def order(self, epoch):
+        """Order of the samples in an epoch"""
+        if not self.shuffle:
+            return np.arange(self.generator.size_train)
+        return np.random.RandomState([self.seed, epoch]).permutation(self.generator.size_train)
+
+    def batch(self, index, epoch):
+        """Batch index of an epoch. The same (index, epoch) gives the same batch."""
+        if not 0 <= index < len(self):
+            raise IndexError("batch %d out of range (%d batches)" % (index, len(self)))
+        start = index * self.generator.batchsize
+        end = min(start + self.generator.batchsize, self.generator.size_train)
+        if self.shuffle:
+            # Sorted, so that memory-mapped arrays are read in order
+            items = np.sort(self.order(epoch)[start:end])
+        else:
+            items = slice(start, end)
+        rng = np.random.RandomState([self.seed, epoch, index])
+        return self.generator.make_batch(items, rng)
+
+    def __getitem__(self, index):
+        return self.batch(index, self.epoch)
+
+    def on_epoch_end(self):
+        self.epoch += 1
+
+
+def prefetch(sequence, workers=4, queue_size=8, epochs=None, initial_epoch=0):
+    """
+    Iterate over the batches of a BatchSequence, in order, for a number of
+    epochs (None for ever). The batches are prepared by a pool of worker
+    threads and kept in a queue of at most queue_size batches, which bounds the
+    memory used. cv2 and numpy release the GIL, so the threads run in parallel
+    with each other and with the training step.
+    Can be given directly to model.fit_generator(..., workers=0).
+    """
+    tasks = queue.Queue()
+    slots = threading.Semaphore(queue_size)
+    results = {}
+    ready = threading.Condition()
+    stop = threading.Event()
+
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            epoch, index = task
+            try:
+                result = (True, sequence.batch(index, epoch))
+            except Exception as e:
+                result = (False, e)
+            with ready:
+                results[task] = result
+                ready.notify_all()
+
+    def schedule():
+        epoch = initial_epoch
+        while epochs is None or epoch < initial_epoch + epochs:
+            for index in range(len(sequence)):
+                slots.acquire()
+                if stop.is_set():
+                    return
+                tasks.put((epoch, index))
+            epoch += 1
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    scheduler = threading.Thread(target=schedule, daemon=True)
+    for thread in threads + [scheduler]:
+        thread.start()
+
+    try:
+        epoch = initial_epoch
+        while epochs is None or epoch < initial_epoch + epochs:
+            for index in range(len(sequence)):
+                with ready:
+                    while (epoch, index) not in results:
+                        ready.wait()
+                    ok, batch = results.pop((epoch, index))
+                slots.release()
+                if not ok:
+                    raise batch
+                yield batch
+            epoch += 1
+    finally:
+        stop.set()
+        slots.release()
+        for _ in threads:
+            tasks.put(None)
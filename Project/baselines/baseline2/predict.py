@@ -0,0 +1,203 @@
+"""
+Streaming inference for baseline2. The test images are read, resized and
+preprocessed in chunks and the predictions of each chunk are appended to the
+csv file as soon as they are computed, so the memory used depends on the chunk
+size and not on the number of images, as long as the input is a stream of
+pickled images, a .npy file or a folder (see iter_images).
+
+/data/X_test.pickle is a single pickled array, which has to be unpickled whole.
+Convert it once to a stream of pickled images:
+    python -m baseline2.predict --input /data/X_test.pickle --save-stream X_test_stream.pickle
+
+Usage (from the baselines folder):
+    python -m baseline2.predict --input X_test_stream.pickle --output predictions.csv \\
+        --model baseline2/models/keypoint_detection.hdf5
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+import itertools
+import numpy as np
+import cv2
+from keras.models import Model, load_model
+from keras.applications.vgg16 import preprocess_input
+
+from baseline2 import decode
+from baseline2.resize_images import preprocess_images, resize_keypoints_to_original_size, RESIZED_SHAPE
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+def iter_images(path):
+    """
+    Iterate over the images in path, one at a time. The memory used is bounded
+    by the size of one image for:
+     - a folder: the image (or .npy) files it contains, in alphabetical order.
+     - a .npy file with a [N, rows, columns(, channels)] array: it is memory
+       mapped and each image is only read when it is needed.
+     - a pickle file with one pickled image after the other (see
+       save_image_stream): each image is only read when it is needed.
+    A pickle file with a list or an array of images (e.g. /data/X_test.pickle,
+    an object array or a [N, rows, columns, channels] array) is also accepted,
+    but it has to be unpickled at once, so the memory used grows with the
+    number of images. Convert it with save_image_stream to avoid this.
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            file = os.path.join(path, name)
+            if name.lower().endswith('.npy'):
+                yield np.load(file)
+            elif name.lower().endswith(IMAGE_EXTENSIONS):
+                yield cv2.cvtColor(cv2.imread(file), cv2.COLOR_BGR2RGB)
+        return
+
+    if path.lower().endswith('.npy'):
+        try:
+            images = np.load(path, mmap_mode='r')
+        except ValueError:
+            raise ValueError("%s cannot be memory mapped (images of different sizes?), "
+                             "save it with save_image_stream instead" % path)
+        for image in images:
+            yield image
+        return
+
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                item = pickle.load(f)
+            except EOFError:
+                return
+            if isinstance(item, (list, tuple)) or (isinstance(item, np.ndarray) and
+                                                   (item.dtype == object or item.ndim == 4)):
+                for image in item:
+                    yield image
+            else:
+                yield item
+
+
+def save_image_stream(images, path):
+    """
+    Write the images (an iterable, e.g. iter_images) to path as a stream of
+    pickled images, one per record, that iter_images reads one at a time.
+    Returns the number of images written.
+    """
+    n_images = 0
+    with open(path, 'wb') as f:
+        for image in images:
+            pickle.dump(np.asarray(image), f, protocol=pickle.HIGHEST_PROTOCOL)
+            n_images += 1
+    return n_images
+
+
+def chunks(iterable, size):
+    """Lists of (at most) size consecutive items of iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def keypoints_model(model):
+    """
+    Sub-model of the trained network that only outputs the 'keypoints' head.
+    The heatmaps are still computed (the keypoints depend on them), but they
+    are not copied out of the network.
+    """
+    return Model(inputs=model.inputs, outputs=model.get_layer('keypoints').output)
+
+
+def predict_stream(model, images, output, chunk_size=32, batch_size=8,
+                   keypoints_only=True, workers=1, heatmap_blend=None):
+    """
+    Predict the keypoints of the images in the original image coordinates.
+
+    Arguments
+    ---------
+    model: trained model (see 3_train).
+    images: iterable of images (e.g. iter_images).
+    output: file name or open text file where the predictions are written, one
+        row of 74 values per image, in the order of images.
+    chunk_size: number of images read, resized and preprocessed at a time.
+    batch_size: batch size of model.predict.
+    keypoints_only: predict with keypoints_model(model), without the heatmaps.
+    workers: processes used to resize each chunk (see preprocess_images).
+    heatmap_blend: if given, the keypoints are also decoded from the predicted
+        heatmaps and blended with the dense head with this weight (see 
+        decode.decode). The full model is used in that case.
+
+    Returns the number of images predicted.
+    """
+    if keypoints_only and heatmap_blend is None:
+        model = keypoints_model(model)
+    if isinstance(output, str):
+        with open(output, 'w') as f:
+            return _predict_chunks(model, images, f, chunk_size, batch_size, workers, heatmap_blend)
+    return _predict_chunks(model, images, output, chunk_size, batch_size, workers, heatmap_blend)
+
+
+def _predict_chunks(model, images, output, chunk_size, batch_size, workers, heatmap_blend):
+    n_images = 0
+    for chunk in chunks(images, chunk_size):
+        X, orig_shapes, _ = preprocess_images(chunk, workers=workers)
+        del chunk
+        X = preprocess_input(X.astype(np.float32))
+        predictions = model.predict(X, batch_size=batch_size)
+        if isinstance(predictions, list):
+            heatmaps, predictions = predictions
+
+        # keypoints were normalized by the width of the resized image
+        keypoints = np.asarray(predictions, dtype=float) * RESIZED_SHAPE[1]
+        if heatmap_blend is not None:
+            keypoints = decode.decode(heatmaps, keypoints, blend=heatmap_blend)
+        keypoints = resize_keypoints_to_original_size(keypoints, orig_shapes)
+
+        np.savetxt(output, keypoints)
+        output.flush()
+        n_images += len(keypoints)
+    return n_images
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming inference for baseline2")
+    parser.add_argument("--input", default="X_test_stream.pickle",
+                        help="stream of pickled images, .npy file or folder with the test images "
+                             "(see iter_images)")
+    parser.add_argument("--output", default="predictions.csv",
+                        help="csv file where the predictions are written")
+    parser.add_argument("--model", default="models/keypoint_detection.hdf5",
+                        help="model saved by 3_train")
+    parser.add_argument("--chunk-size", type=int, default=32,
+                        help="number of images in memory at a time")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used to resize the images")
+    parser.add_argument("--all-outputs", action="store_true",
+                        help="run the full model instead of the keypoints head only")
+    parser.add_argument("--heatmap-blend", type=float, default=None,
+                        help="weight of the keypoints decoded from the heatmaps (0 to 1)")
+    parser.add_argument("--save-stream", default=None,
+                        help="only convert --input to a stream of pickled images saved here")
+    args = parser.parse_args(argv)
+
+    if args.save_stream:
+        n_images = save_image_stream(iter_images(args.input), args.save_stream)
+        print("\t%d images saved to %s" % (n_images, args.save_stream))
+        return
+
+    start_time = time.time()
+    model = load_model(args.model)
+    n_images = predict_stream(model, iter_images(args.input), args.output,
+                              chunk_size=args.chunk_size, batch_size=args.batch_size,
+                              keypoints_only=not args.all_outputs, workers=args.workers,
+                              heatmap_blend=args.heatmap_blend)
+    total_time = time.time() - start_time
+    print("\tFinished: %d images in %.1f s (%.2f images/s)"
+          % (n_images, total_time, n_images / total_time))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,39 +1,108 @@
+import os
+import hashlib
 import numpy as np 
-from skimage import transform 
-from scipy import misc
-
-def resize(images): 
-    X = []
-    orig_shape = []
-    for i in range(images.shape[0]):
-        rows, columns, channels = images[i].shape
-        orig_shape.append([rows, columns, channels])
-        x1 = rows/1536
-        x2 = columns/2048
-        aux = np.array(images[i])
-        aux = transform.resize(aux, (aux.shape[0] / x1, aux.shape[1] / x2))
-        aux = misc.imresize(aux,25)
-        aux = np.reshape(aux,(384,512,3))
-        X.append(aux)
+import cv2
+from concurrent.futures import ProcessPoolExecutor
 
+# Shape (rows, columns) of the images given to the network
+RESIZED_SHAPE = (384, 512)
+
+
+def resize_image(image, shape=RESIZED_SHAPE):
+    """
+    Resize an image to shape in a single pass. INTER_AREA averages the source
+    pixels covered by each output pixel, which is the right filter for large 
+    reductions and avoids the intermediate 1536x2048 float image.
+    """
+    image = np.asarray(image)
+    return cv2.resize(image, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+
+
+def image_hash(image, shape=RESIZED_SHAPE):
+    """Key of the resized image in the cache: content of the image and target shape"""
+    image = np.ascontiguousarray(image)
+    h = hashlib.sha1()
+    h.update(str((image.shape, image.dtype.str, tuple(shape))).encode())
+    h.update(image.data)
+    return h.hexdigest()
+
+
+def preprocess_images(images, workers=None, cache_dir=None, shape=RESIZED_SHAPE):
+    """
+    Resize all images to shape.
+
+    Arguments
+    ---------
+    images: list or array of images (they may have different shapes).
+    workers: number of worker processes (None uses all cpus, 1 runs in this process).
+    cache_dir: if given, resized images are stored there as <hash>.npy, keyed by
+        the content of the source image, and only the images that are not in the
+        cache are resized.
+
+    Returns the resized images as an uint8 array [N, rows, columns, 3], the 
+    original shapes [N, 3] and the scale factors of the keypoints [N, 2], i.e.
+    the (x, y) factors that take a keypoint in the original image to the resized one.
+    """
+    orig_shapes = np.array([np.shape(image) for image in images])
+    scales = keypoint_scales(orig_shapes, shape)[:, 0:2]
+    X = np.empty((len(images), shape[0], shape[1], 3), dtype=np.uint8)
+
+    pending = list(range(len(images)))
+    if cache_dir is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        paths = [os.path.join(cache_dir, image_hash(image, shape) + ".npy") for image in images]
+        pending = []
+        for i, path in enumerate(paths):
+            if os.path.exists(path):
+                X[i] = np.load(path)
+            else:
+                pending.append(i)
+
+    if workers == 1 or len(pending) <= 1:
+        resized = [resize_image(images[i], shape) for i in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            resized = list(executor.map(resize_image, [images[i] for i in pending],
+                                        [shape] * len(pending)))
+
+    for i, image in zip(pending, resized):
+        X[i] = image
+        if cache_dir is not None:
+            np.save(paths[i], image)
+
+    return X, orig_shapes, scales
+
+
+def resize(images, workers=None, cache_dir=None): 
+    """
+    Resize the images to 384x512 (see preprocess_images). Returns the resized 
+    images and their original shapes.
+    """
+    X, orig_shape, _ = preprocess_images(images, workers=workers, cache_dir=cache_dir)
     return X, orig_shape
 
 
-def resize_keypoints_to_original_size(keypoint_predictions, X_original):
-    X_original = np.array(X_original)
-    keypoint_predictions = np.array(keypoint_predictions)
-    
-    final_predictions = [] 
-
-    for i in range(X_original.shape[0]):
-        rows, columns, channels = np.shape(X_original[i])
-        x1 = rows / 1536
-        x2 = columns / 2048
-        for j in range(74): 
-            if(j % 2 == 0):
-                keypoint_predictions[i][j] *= x2
-            else: 
-                keypoint_predictions[i][j] *= x1
-        final_predictions.append(keypoint_predictions[i] * 4)
-        
-    return final_predictions
\ No newline at end of file
+def keypoint_scales(orig_shapes, shape=RESIZED_SHAPE):
+    """
+    Factors [N, 74] that take the keypoints of images with the original shapes 
+    orig_shapes ([N, 2] or [N, 3], rows first) to images resized to shape.
+    Keypoints alternate x (column) and y (row) coordinates.
+    """
+    orig_shapes = np.asarray(orig_shapes, dtype=float)
+    scales = np.stack([shape[1] / orig_shapes[:, 1], shape[0] / orig_shapes[:, 0]], axis=1)
+    return np.tile(scales, 37)
+
+
+def resize_keypoints(keypoints, orig_shapes, shape=RESIZED_SHAPE):
+    """Keypoints [N, 74] of the original images in the coordinates of the resized images"""
+    return np.asarray(keypoints, dtype=float) * keypoint_scales(orig_shapes, shape)
+
+
+def resize_keypoints_to_original_size(keypoint_predictions, orig_shapes, shape=RESIZED_SHAPE):
+    """
+    Keypoints [N, 74] predicted in the resized images, in pixels, in the 
+    coordinates of the original images (the inverse of resize_keypoints). 
+    orig_shapes are the original shapes returned by resize.
+    """
+    return np.asarray(keypoint_predictions, dtype=float) / keypoint_scales(orig_shapes, shape)
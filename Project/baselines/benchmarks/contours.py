@@ -0,0 +1,200 @@
+"""
+Comparison of the search methods of the breast contour (see
+baseline1.process_image.breast_contour) with the "exact" shortest path, on
+synthetic images (see benchmarks/synthetic.py).
+
+Usage (from the baselines folder):
+    python -m benchmarks.contours --images 10 --methods pyramid,polar
+    python -m benchmarks.contours --images 10 --searches bidirectional,astar
+
+Each contour is searched between the true end points of the breast in the
+image resized as in model.test. For each method the table reports the median
+time, the breast score (distance of the 17 points of the contour to the true
+contour, normalized by the diagonal, as in scoring.measure_distances), its
+difference with the score of the exact method, the maximum distance in pixels
+of the contour to the exact one and the ratio of the cost of the path (the
+sum of the weights of dists.dist_with_prior) to that of the exact one, at
+least 1 since the exact method returns the shortest path in the pixel grid.
+
+With --searches, the shortest path searches of the exact method (see
+baseline1.process_image.grid_search) are compared with Dijkstra instead: the
+median time, the vertices expanded, their ratio to those expanded by
+Dijkstra and the largest relative difference of the cost of the path, which
+is 0 (up to rounding) since all of them are optimal.
+"""
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import sys
+import time
+import argparse
+import numpy as np
+
+from utils import dists, scoring, profiler
+import baseline1.config as config
+import baseline1.process_image as proc
+from benchmarks import synthetic
+
+METHODS = ["exact", "pyramid", "polar"]
+SEARCHES = ["dijkstra", "bidirectional", "astar"]
+
+
+def path_cost(M, pl, pr, path):
+    """Sum of the weights (dists.dist_with_prior) of the edges of an 8-connected path"""
+    path = np.asarray(path)
+    center = (np.asarray(pl) + np.asarray(pr)) / 2
+    radius = dists.compute_euclidean_distance(np.asarray(pl), np.asarray(pr)) / 2
+    shape_prior = dists.circle(center, radius, M.shape)
+    u, v = path[:-1], path[1:]
+    z = 255 - np.minimum(M[u[:, 0], u[:, 1]], M[v[:, 0], v[:, 1]])
+    prior = np.maximum(shape_prior[u[:, 0], u[:, 1]], shape_prior[v[:, 0], v[:, 1]])
+    length = np.linalg.norm(v - u, axis=1)
+    return float(np.sum(length * (0.15 * np.exp(0.25 * z + 3 * prior) + 1.85)))
+
+
+def breast_score(boundary, truth, diagonal):
+    """Breast error of one contour ((row, col) path) given its 17 true (x, y) points"""
+    index = np.round(np.linspace(0, len(boundary) - 1, 17)).astype(int)
+    detections = np.flip(np.asarray(boundary)[index], axis=1).astype(float)
+    return scoring.get_curves_distance_np(truth, detections, n_points=diagonal) / diagonal
+
+
+def contours(n_images=10, shape=(384, 512)):
+    """
+    Gradient magnitude, end points and true points of each breast contour of
+    n_images synthetic images, resized as in model.test
+    """
+    for seed in range(n_images):
+        img, scalling_factor = proc.preprocess_img(synthetic.torso(shape, seed), ret_scalling_factor=True)
+        M = dists.gradient(np.average(img, axis=2))
+        points = synthetic.keypoints(shape, seed).reshape([-1, 2]) * scalling_factor
+        diagonal = dists.compute_euclidean_distance(np.zeros([2]), np.asarray(M.shape))
+        # left breast from its lateral end, right breast from its medial end (pl left of pr)
+        for truth in (points[0:17], points[33:16:-1]):
+            pl = (int(truth[0, 1]), int(truth[0, 0]))
+            pr = (int(truth[-1, 1]), int(truth[-1, 0]))
+            yield M, pl, pr, truth, diagonal
+
+
+def compare(methods, n_images=10, shape=(384, 512)):
+    """
+    Results of each method (and of "exact") on the contours of n_images images:
+    {method: {"time", "score", "score_delta", "max_distance", "cost_ratio"}}
+    with the median time and cost ratio (the cost grows exponentially with the
+    weakest gradient of the path, so a few contours dominate its mean) and the
+    mean of the other values over the contours.
+    """
+    methods = ["exact"] + [m for m in methods if m != "exact"]
+    values = {m: {"time": [], "score": [], "score_delta": [], "max_distance": [], "cost_ratio": []}
+              for m in methods}
+    for M, pl, pr, truth, diagonal in contours(n_images, shape):
+        exact = None
+        for method in methods:
+            start = time.perf_counter()
+            boundary = proc.breast_contour(M, pl, pr, debug_verbose=False, method=method)
+            elapsed = time.perf_counter() - start
+            score = breast_score(boundary, truth, diagonal)
+            cost = path_cost(M, pl, pr, boundary)
+            if exact is None:
+                exact = boundary, score, cost
+            distance = scoring.point_to_polyline_distance(boundary.astype(float), exact[0].astype(float))
+            results = values[method]
+            results["time"].append(elapsed)
+            results["score"].append(score)
+            results["score_delta"].append(score - exact[1])
+            results["max_distance"].append(distance.max())
+            results["cost_ratio"].append(cost / exact[2])
+
+    medians = ("time", "cost_ratio")
+    return {m: {k: float(np.median(v[k]) if k in medians else np.mean(v[k])) for k in v}
+            for m, v in values.items()}
+
+
+def compare_searches(searches, n_images=10, shape=(384, 512), astar_delta=None):
+    """
+    Results of each search (and of "dijkstra") of the exact method on the
+    contours of n_images images: {search: {"time", "expanded", "expanded_ratio",
+    "cost_difference"}} with the median time, the mean number of expanded
+    vertices and ratio, and the maximum relative difference of the cost.
+    astar_delta replaces config.astar_delta during the comparison.
+    """
+    default_delta, config.astar_delta = config.astar_delta, astar_delta
+    try:
+        return _compare_searches(searches, n_images, shape)
+    finally:
+        config.astar_delta = default_delta
+
+
+def _compare_searches(searches, n_images, shape):
+    searches = ["dijkstra"] + [s for s in searches if s != "dijkstra"]
+    values = {s: {"time": [], "expanded": [], "expanded_ratio": [], "cost_difference": []}
+              for s in searches}
+    for M, pl, pr, truth, diagonal in contours(n_images, shape):
+        reference = None
+        for search in searches:
+            prof = profiler.Profile(search)
+            start = time.perf_counter()
+            with prof:
+                boundary = proc.breast_contour(M, pl, pr, debug_verbose=False, method="exact",
+                                               search=search)
+            elapsed = time.perf_counter() - start
+            expanded = sum(n for name, n in prof.counters.items() if name.endswith("expanded"))
+            cost = path_cost(M, pl, pr, boundary)
+            if reference is None:
+                reference = expanded, cost
+            results = values[search]
+            results["time"].append(elapsed)
+            results["expanded"].append(expanded)
+            results["expanded_ratio"].append(expanded / reference[0])
+            results["cost_difference"].append(abs(cost - reference[1]) / reference[1])
+
+    return {s: {"time": float(np.median(v["time"])),
+                "expanded": float(np.mean(v["expanded"])),
+                "expanded_ratio": float(np.mean(v["expanded_ratio"])),
+                "cost_difference": float(np.max(v["cost_difference"]))}
+            for s, v in values.items()}
+
+
+def format_searches(results):
+    lines = ["%-14s %10s %10s %10s %12s" % ("search", "time (s)", "expanded", "ratio", "cost diff")]
+    for search, r in results.items():
+        lines.append("%-14s %10.4f %10.0f %10.3f %12.2e" % (search, r["time"], r["expanded"],
+                     r["expanded_ratio"], r["cost_difference"]))
+    return "\n".join(lines)
+
+
+def format_results(results):
+    lines = ["%-10s %10s %10s %12s %12s %10s" % ("method", "time (s)", "score", "score delta",
+                                                 "max dist", "cost ratio")]
+    for method, r in results.items():
+        lines.append("%-10s %10.4f %10.5f %12.5f %12.2f %10.4f" % (method, r["time"], r["score"],
+                     r["score_delta"], r["max_distance"], r["cost_ratio"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Breast contour methods compared with the exact search")
+    parser.add_argument("--images", type=int, default=10, help="number of synthetic images")
+    parser.add_argument("--size", type=int, default=0,
+                        help="index of the image size %s" % synthetic.SIZES)
+    parser.add_argument("--methods", default=",".join(METHODS[1:]),
+                        help="comma separated methods compared with exact")
+    parser.add_argument("--searches", default=None,
+                        help="comma separated searches (%s) compared with dijkstra, "
+                             "instead of the methods" % ", ".join(SEARCHES[1:]))
+    parser.add_argument("--astar-delta", type=float, default=None,
+                        help="astar_delta of the A* search (see process_image.grid_search)")
+    args = parser.parse_args(argv)
+
+    shape = synthetic.SIZES[args.size]
+    if args.searches:
+        results = compare_searches(args.searches.split(","), args.images, shape, args.astar_delta)
+        print(format_searches(results))
+    else:
+        results = compare(args.methods.split(","), args.images, shape)
+        print(format_results(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Performance benchmarks of baseline1 and of the scoring, on synthetic images
+(see benchmarks/synthetic.py), so they run offline and without the data of the
+challenge.
+
+Usage (from the baselines folder):
+    python -m benchmarks.run --output benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+Each benchmark is run --repeat times and the median and minimum times are
+recorded. With --compare the results are compared with a previous run and the
+benchmarks whose median is more than --tolerance slower are reported; the
+exit status is 1 if there is any.
+"""
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+from utils import dists, scoring
+import baseline1.config as config
+import baseline1.model as model
+import baseline1.process_image as proc
+import baseline1.registry as registry
+from benchmarks import synthetic
+
+
+def gradient(shape):
+    grey = np.average(synthetic.torso(shape), axis=2)
+    return lambda: dists.gradient(grey)
+
+
+def _working_image(shape):
+    """Image resized as in model.test and its gradient magnitude"""
+    img, scalling_factor = proc.preprocess_img(synthetic.torso(shape), ret_scalling_factor=True)
+    return img, dists.gradient(np.average(img, axis=2)), scalling_factor
+
+
+def shortest_path_grid(shape):
+    grey = np.average(synthetic.torso(shape), axis=2)
+    dist_mat = dists.dist_matrix(dists.gradient(grey))
+    bottom = dist_mat[shape[0]//2:]
+    return lambda: dists.shortest_path_grid(bottom, start="last")
+
+
+def _contour_window(shape, rows=96, cols=160):
+    """
+    Gradient, shape prior and end points of the left breast contour of the
+    image resized as in model.test, limited to a rows x cols window at the
+    lateral end of the contour (the full contour takes too long with build_graph).
+    """
+    img, M, scalling_factor = _working_image(shape)
+    points = synthetic.keypoints(shape).reshape([-1, 2]) * scalling_factor
+    pl = (int(points[0, 1]), int(points[0, 0]))
+    pm = (int(points[16, 1]), int(points[16, 0]))
+    center = (np.asarray(pl) + np.asarray(pm)) / 2
+    radius = dists.compute_euclidean_distance(np.asarray(pl), np.asarray(pm)) / 2
+    shape_prior = dists.circle(center, radius, M.shape)
+    top, left = pl[0] - 8, max(pl[1] - 20, 0)
+    limits = [top, left, min(top + rows, M.shape[0]), min(left + cols, M.shape[1])]
+    # end point: the point of the contour closest to the bottom right corner of the window
+    inside = [(int(r), int(c)) for c, r in points[0:17]
+              if limits[0] <= r < limits[2] and limits[1] <= c < limits[3]]
+    return M, shape_prior, limits, pl, inside[-1]
+
+
+def build_graph_dijkstra(shape):
+    M, shape_prior, limits, start, end = _contour_window(shape)
+    def run():
+        G = dists.build_graph((M, shape_prior), {end}, direction="all", subimage=limits,
+                              dist_func=dists.dist_with_prior)
+        return dists.shortestPath(G, start, dists.end_point_flag)
+    return run
+
+
+def grid_shortest_path(shape):
+    M, shape_prior, limits, start, end = _contour_window(shape)
+    def run():
+        edge_weights = dists.edge_weights_with_prior(M, shape_prior, limits)
+        return dists.grid_shortest_path(edge_weights, start, {end}, subimage=limits)
+    return run
+
+
+def bidirectional_grid_shortest_path(shape):
+    M, shape_prior, limits, start, end = _contour_window(shape)
+    def run():
+        edge_weights = dists.edge_weights_with_prior(M, shape_prior, limits)
+        return dists.bidirectional_grid_shortest_path(edge_weights, start, {end}, subimage=limits)
+    return run
+
+
+def breast_contour(shape, method="exact"):
+    img, M, scalling_factor = _working_image(shape)
+    points = synthetic.keypoints(shape).reshape([-1, 2]) * scalling_factor
+    pl = (int(points[0, 1]), int(points[0, 0]))
+    pm = (int(points[16, 1]), int(points[16, 0]))
+    return lambda: proc.breast_contour(M, pl, pm, debug_verbose=False, method=method)
+
+
+def breast_contour_pyramid(shape):
+    return breast_contour(shape, method="pyramid")
+
+
+def breast_contour_polar(shape):
+    return breast_contour(shape, method="polar")
+
+
+def _breast(shape):
+    img, M, scalling_factor = _working_image(shape)
+    points = synthetic.keypoints(shape).reshape([-1, 2]) * scalling_factor
+    # (row, col) contour of the left breast, as returned by breast_contour
+    return img, np.flip(points[0:17], axis=1)
+
+
+def get_breast_mask(shape):
+    img, breast = _breast(shape)
+    return lambda: proc.get_breast_mask(img.shape[0:2], breast, debug_verbose=False)
+
+
+def nipple(shape):
+    img, breast = _breast(shape)
+    params = registry.get_model("left_nipple_params")
+    return lambda: proc.nipple(img, breast, params, debug_verbose=False)
+
+
+def model_test(shape):
+    img = synthetic.torso(shape)
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return model.test(img, testing=True, time_debug=False)
+    return run
+
+
+def generate_scores(shape, n_images=20):
+    rng = np.random.RandomState(0)
+    _, ground_truth = synthetic.dataset(n_images, shape)
+    predictions = ground_truth + rng.normal(0, 0.01 * shape[1], ground_truth.shape)
+    shapes = [shape + (3,)] * n_images
+    return lambda: scoring.generate_scores(predictions, ground_truth, shapes)
+
+
+# name, function returning the callable to time given the image shape, sizes
+# (indices of synthetic.SIZES) where it is run. Stages that work on the image
+# resized by model.test only depend on the size through preprocess_img.
+BENCHMARKS = [
+    ("gradient", gradient, [0, 1, 2]),
+    ("shortest_path_grid", shortest_path_grid, [0, 1, 2]),
+    ("build_graph+dijkstra", build_graph_dijkstra, [0]),
+    ("grid_shortest_path", grid_shortest_path, [0]),
+    ("bidirectional_grid_shortest_path", bidirectional_grid_shortest_path, [0]),
+    ("breast_contour", breast_contour, [0]),
+    ("breast_contour_pyramid", breast_contour_pyramid, [0]),
+    ("breast_contour_polar", breast_contour_polar, [0]),
+    ("get_breast_mask", get_breast_mask, [0]),
+    ("nipple", nipple, [0]),
+    ("model.test", model_test, [0, 1, 2]),
+    ("generate_scores", generate_scores, [0, 2]),
+]
+
+
+def time_function(function, repeat=5):
+    """Median and minimum time (s) of repeat calls, after one warm-up call"""
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"median": float(np.median(times)), "min": float(np.min(times)), "repeat": repeat}
+
+
+def environment():
+    return {"python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "system": platform.system(),
+            "cpus": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def run(names=None, sizes=None, repeat=5, verbose=True):
+    """
+    Run the benchmarks (all, or those in names) at the given sizes (indices
+    of synthetic.SIZES, all by default). Returns {"environment": ...,
+    "results": {"name[rowsxcols]": time_function result}}.
+    """
+    with tempfile.TemporaryDirectory() as models_dir:
+        synthetic.write_models(models_dir, config.image_size)
+        model.load_models(models_dir)
+
+        results = {}
+        for name, setup, name_sizes in BENCHMARKS:
+            if names and name not in names:
+                continue
+            for size in name_sizes:
+                if sizes is not None and size not in sizes:
+                    continue
+                shape = synthetic.SIZES[size]
+                key = "%s[%dx%d]" % (name, shape[0], shape[1])
+                results[key] = time_function(setup(shape), repeat)
+                if verbose:
+                    print("%-40s %10.4f s" % (key, results[key]["median"]))
+    return {"environment": environment(), "results": results}
+
+
+def compare(results, baseline, tolerance=0.2, min_difference=0.001):
+    """
+    Benchmarks in both results whose median time increased more than tolerance
+    (relative) and min_difference seconds. Returns a list of (name, baseline
+    time, time, ratio) and prints the comparison of every benchmark.
+    """
+    slower = []
+    print("%-40s %10s %10s %8s" % ("benchmark", "baseline", "now", "ratio"))
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            print("%-40s %10s %10.4f %8s" % (name, "-", result["median"], "new"))
+            continue
+        before = baseline["results"][name]["median"]
+        now = result["median"]
+        ratio = now / before if before > 0 else np.inf
+        flag = ratio > 1 + tolerance and now - before > min_difference
+        print("%-40s %10.4f %10.4f %8.2f%s" % (name, before, now, ratio, "  SLOWER" if flag else ""))
+        if flag:
+            slower.append((name, before, now, ratio))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="baseline1 and scoring benchmarks")
+    parser.add_argument("--output", default=None,
+                        help="json file where the results are written (e.g. a new baseline)")
+    parser.add_argument("--compare", default=None,
+                        help="json file with the results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown reported by --compare")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sizes", default=None,
+                        help="comma separated indices of the image sizes %s" % synthetic.SIZES)
+    parser.add_argument("benchmarks", nargs="*",
+                        help="benchmarks to run (all by default): %s"
+                             % ", ".join(name for name, _, _ in BENCHMARKS))
+    args = parser.parse_args(argv)
+
+    sizes = None if args.sizes is None else [int(s) for s in args.sizes.split(",")]
+    results = run(args.benchmarks, sizes, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.tolerance)
+        if slower:
+            print("%d benchmarks are slower than the baseline" % len(slower))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Deterministic synthetic torso images for the benchmarks.
+
+The images mimic the structure the baseline1 pipeline looks for: skin in the
+middle of the image, dark background on both sides of the body in the bottom
+half, the lower contour of each breast and a darker nipple. The 74 keypoints
+(x, y alternated, in the order of the ground truth of the challenge) are
+known exactly: 17 points of the left breast contour (lateral to medial), 17
+of the right one (lateral to medial), the jugular notch and the two nipples.
+"""
+import os
+import numpy as np
+import cv2
+
+SKIN = (200, 160, 140)
+BACKGROUND = (30, 30, 30)
+CONTOUR = (150, 110, 100)
+NIPPLE = (120, 70, 60)
+
+# (rows, columns) of the benchmark images
+SIZES = [(384, 512), (768, 1024), (1536, 2048)]
+
+
+def geometry(shape, seed=0):
+    """Random (but reproducible) position of the breasts of one image"""
+    rows, cols = shape
+    rng = np.random.RandomState(seed)
+    breasts = []
+    for cx in (0.33, 0.67):
+        breasts.append({"center": ((cx + rng.uniform(-0.01, 0.01)) * cols,
+                                   (0.5 + rng.uniform(-0.01, 0.01)) * rows),
+                        "axes": (0.16 * cols * rng.uniform(0.95, 1.05),
+                                 0.2 * rows * rng.uniform(0.95, 1.05))})
+    return breasts
+
+
+def keypoints(shape, seed=0):
+    """The 74 keypoints of torso(shape, seed)"""
+    rows, cols = shape
+    left, right = geometry(shape, seed)
+    points = []
+    # Left breast from its lateral (left) end, right breast from its lateral (right) end
+    for breast, angles in ((left, np.linspace(np.pi, 0, 17)), (right, np.linspace(0, np.pi, 17))):
+        (cx, cy), (ax, ay) = breast["center"], breast["axes"]
+        points.append(np.stack([cx + ax * np.cos(angles), cy + ay * np.sin(angles)], axis=1))
+    notch = [cols / 2, 0.25 * rows]
+    nipples = [[b["center"][0], 0.6 * rows] for b in (left, right)]
+    points.append(np.array([notch] + nipples))
+    return np.concatenate(points).ravel()
+
+
+def torso(shape=(384, 512), seed=0):
+    """Synthetic torso image (uint8, RGB) with the given (rows, columns)"""
+    rows, cols = shape
+    rng = np.random.RandomState(seed)
+    image = np.empty((rows, cols, 3), dtype=np.uint8)
+    image[:] = SKIN
+    top = int(0.45 * rows)
+    image[top:, :int(0.15 * cols)] = BACKGROUND
+    image[top:, int(0.85 * cols):] = BACKGROUND
+
+    thickness = max(1, int(round(3 * cols / 512)))
+    for breast in geometry(shape, seed):
+        (cx, cy), (ax, ay) = breast["center"], breast["axes"]
+        cv2.ellipse(image, (int(round(cx)), int(round(cy))), (int(round(ax)), int(round(ay))),
+                    0, 0, 180, CONTOUR, thickness)
+        cv2.circle(image, (int(round(cx)), int(round(0.6 * rows))), max(2, int(round(5 * cols / 512))),
+                   NIPPLE, -1)
+
+    noise = rng.randint(-3, 3, size=image.shape)
+    return np.clip(image.astype(int) + noise, 0, 255).astype(np.uint8)
+
+
+def dataset(n, shape=(384, 512), seed=0):
+    """n images and their keypoints [n, 74]"""
+    images = [torso(shape, seed + i) for i in range(n)]
+    return images, np.stack([keypoints(shape, seed + i) for i in range(n)])
+
+
+def write_models(directory, image_size=512):
+    """
+    Models for baseline1 (see baseline1.registry.MODEL_NAMES) that match the
+    synthetic images, for images resized to image_size columns: nipple models
+    with the angle, distance to the border of the breast and colour difference
+    of the nipples, and the mean keypoints as mean model.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    shape = (int(round(image_size * 0.75)), image_size)
+    color = np.subtract(NIPPLE, SKIN)
+    # [means, stds] of angle, distance, and the three colour channels
+    nipple_params = np.array([[np.pi / 2, 0.08 * shape[0], *color],
+                              [0.3, 0.05 * shape[0], 30, 30, 30]], dtype=float)
+    np.save(os.path.join(directory, "left_nipple_params.npy"), nipple_params)
+    np.save(os.path.join(directory, "right_nipple_params.npy"), nipple_params)
+    np.save(os.path.join(directory, "mean_model.npy"), keypoints(shape, seed=0))
@@ -0,0 +1,2 @@
+# The tests import the packages of this folder (utils, baseline1, baseline2, ...)
+# as the notebooks and scripts do, so pytest adds it to sys.path through this file.
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from baseline2 import dataset
+
+
+@pytest.mark.parametrize("n", [2, 5, 10, 37, 100, 1001])
+@pytest.mark.parametrize("test_size,random_state", [(0.2, 42), (0.25, 0), (0.5, 7)])
+def test_split_indices_same_as_sklearn(n, test_size, random_state):
+    model_selection = pytest.importorskip("sklearn.model_selection")
+    train, validation = model_selection.train_test_split(np.arange(n), test_size=test_size,
+                                                         random_state=random_state)
+    new_train, new_validation = dataset.split_indices(n, test_size, random_state)
+    np.testing.assert_array_equal(new_train, train)
+    np.testing.assert_array_equal(new_validation, validation)
+
+
+def test_write_dataset_splits(tmp_path):
+    model_selection = pytest.importorskip("sklearn.model_selection")
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 256, size=(23, 6, 8, 3)).astype(np.uint8)
+    y = rng.uniform(0, 1, size=(23, 74))
+    # as the notebooks split the pickles
+    X_train, X_validation, y_train, y_validation = model_selection.train_test_split(
+        X, y, test_size=0.2, random_state=42)
+
+    dataset.write_dataset(str(tmp_path), {"X": X, "y": y})
+    data = dataset.open_dataset(str(tmp_path))
+    assert len(data) == 23 and sorted(data.names()) == ["X", "order", "y"]
+    np.testing.assert_array_equal(data.split("train", "X"), X_train)
+    np.testing.assert_array_equal(data.split("validation", "X"), X_validation)
+    np.testing.assert_array_equal(data.split("train", "y"), y_train)
+    np.testing.assert_array_equal(data.split("validation", "y"), y_validation)
+    np.testing.assert_array_equal(X[data["order"]], data["X"])
+    assert isinstance(data["X"], np.memmap)
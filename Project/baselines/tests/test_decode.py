@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from baseline2 import decode
+
+
+def _gaussian(x, y, shape=(40, 60), sigma=2.0):
+    rows, cols = np.mgrid[0:shape[0], 0:shape[1]]
+    return np.exp(-((cols - x) ** 2 + (rows - y) ** 2) / (2 * sigma ** 2))[None]
+
+
+@pytest.mark.parametrize("method", ["quadratic", "soft_argmax"])
+@pytest.mark.parametrize("x, y", [(30.3, 20.0), (29.7, 19.6), (25.0, 12.45)])
+def test_refine_peaks_subpixel(method, x, y):
+    heatmaps = _gaussian(x, y)
+    peaks = decode.find_peaks(heatmaps, threshold=0.5)
+    assert len(peaks[0]) == 1
+    position = decode.refine_peaks(heatmaps, peaks, method=method)[0]
+    # closer to the true peak than the pixel found by find_peaks
+    integer = np.array([peaks[2][0], peaks[1][0]])
+    assert np.all(np.abs(position - [x, y]) <= np.abs(integer - [x, y]) + 1e-3)
+    np.testing.assert_allclose(position, [x, y], atol=0.1)
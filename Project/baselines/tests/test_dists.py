@@ -0,0 +1,186 @@
+import numpy as np
+import pytest
+
+from utils import dists
+
+SUBIMAGES = [[5, 7, 25, 30], [0, 0, 30, 40], [0, 10, 18, 40]]
+
+
+def _image(shape=(30, 40), seed=0):
+    rng = np.random.RandomState(seed)
+    M = rng.uniform(0, 255, size=shape)
+    shape_prior = dists.circle((15, 20), 9, shape)
+    return M, shape_prior
+
+
+def _matrix_dist(matrix, u, v):
+    """Scalar edge weight of shortest_path_grid: length times the mean pixel weight"""
+    d = np.sqrt((u[0] - v[0]) ** 2 + (u[1] - v[1]) ** 2)
+    return d * (matrix[u] + matrix[v]) / 2
+
+
+def _assert_planes_match_graph(planes, G, subimage):
+    top, left, bottom, right = subimage
+    assert planes.shape == (8, bottom - top, right - left)
+    for i in range(top, bottom):
+        for j in range(left, right):
+            for k, (di, dj) in enumerate(dists.GRID_NEIGHBOURS):
+                v = (i + di, j + dj)
+                weight = planes[k, i - top, j - left]
+                if v in G[(i, j)]:
+                    assert weight == pytest.approx(G[(i, j)][v], rel=1e-12)
+                else:
+                    # edges leaving the subimage
+                    assert weight == np.inf
+
+
+@pytest.mark.parametrize("subimage", SUBIMAGES)
+def test_edge_weights_with_prior(subimage):
+    M, shape_prior = _image()
+    planes = dists.edge_weights_with_prior(M, shape_prior, subimage)
+    G = dists.build_graph((M, shape_prior), [], direction="all", subimage=subimage,
+                          dist_func=dists.dist_with_prior)
+    _assert_planes_match_graph(planes, G, subimage)
+
+
+@pytest.mark.parametrize("subimage", SUBIMAGES)
+def test_edge_weights_from_matrix(subimage):
+    M, _ = _image(seed=1)
+    matrix = dists.dist_matrix(M)
+    planes = dists.edge_weights_from_matrix(matrix, subimage)
+    G = dists.build_graph(matrix, [], direction="all", subimage=subimage, dist_func=_matrix_dist)
+    _assert_planes_match_graph(planes, G, subimage)
+
+
+def _path_cost(edge_weights, path, subimage):
+    cost = 0.0
+    for u, v in zip(path[:-1], path[1:]):
+        k = dists.GRID_NEIGHBOURS.index((v[0] - u[0], v[1] - u[1]))
+        cost += edge_weights[k, u[0] - subimage[0], u[1] - subimage[1]]
+    return cost
+
+
+def _searches(edge_weights):
+    astar_delta = dists.min_weight_per_length(edge_weights)
+    return {
+        "dijkstra": lambda s, e, sub: dists.grid_shortest_path(edge_weights, s, e, sub),
+        "bidirectional": lambda s, e, sub: dists.bidirectional_grid_shortest_path(edge_weights, s, e, sub),
+        "astar": lambda s, e, sub: dists.grid_shortest_path(edge_weights, s, e, sub,
+                                                            astar_delta=astar_delta),
+    }
+
+
+def _random_problem(rng):
+    h, w = rng.randint(2, 20, size=2)
+    subimage = [3, 4, 3 + h, 4 + w]
+    matrix = rng.uniform(0, 50, size=(h + 10, w + 10))
+    edge_weights = dists.edge_weights_from_matrix(matrix, subimage)
+    if rng.rand() < 0.5:
+        edge_weights[rng.rand(*edge_weights.shape) < 0.3] = np.inf
+
+    def point():
+        return (rng.randint(subimage[0], subimage[2]), rng.randint(subimage[1], subimage[3]))
+    return edge_weights, subimage, point(), {point() for _ in range(rng.randint(1, 4))}
+
+
+def test_searches_are_optimal():
+    rng = np.random.RandomState(0)
+    unreachable = 0
+    for _ in range(300):
+        edge_weights, subimage, start, end_points = _random_problem(rng)
+        paths = {}
+        for name, search in _searches(edge_weights).items():
+            try:
+                paths[name] = search(start, end_points, subimage)
+            except ValueError:
+                paths[name] = None
+        if paths["dijkstra"] is None:
+            unreachable += 1
+            assert paths == {name: None for name in paths}
+            continue
+        cost = _path_cost(edge_weights, paths["dijkstra"], subimage)
+        for name, path in paths.items():
+            assert path[0] == start and path[-1] in end_points
+            assert _path_cost(edge_weights, path, subimage) == pytest.approx(cost, rel=1e-9), name
+    # the random infinite edges leave some end points unreachable
+    assert unreachable > 0
+
+
+def test_searches_unreachable_end_point():
+    subimage = [0, 0, 10, 12]
+    edge_weights = dists.edge_weights_from_matrix(np.ones((10, 12)), subimage)
+    # no edge crosses column 6
+    edge_weights[:, :, 5:7] = np.inf
+    for name, search in _searches(edge_weights).items():
+        with pytest.raises(ValueError):
+            search((2, 1), {(8, 10), (3, 9)}, subimage)
+
+
+def test_grid_search_methods():
+    import baseline1.process_image as proc
+    M, shape_prior = _image(seed=2)
+    subimage = [10, 2, 30, 38]
+    edge_weights = dists.edge_weights_with_prior(M, shape_prior, subimage)
+    pl, pr = (11, 3), (12, 36)
+    costs = [_path_cost(edge_weights, proc.grid_search(edge_weights, pl, pr, subimage, search), subimage)
+             for search in ("dijkstra", "bidirectional", "astar")]
+    assert costs[1] == pytest.approx(costs[0], rel=1e-12)
+    assert costs[2] == pytest.approx(costs[0], rel=1e-12)
+    with pytest.raises(ValueError):
+        proc.grid_search(edge_weights, pl, pr, subimage, "unknown")
+
+
+def _shortest_path_grid_loops(matrix, start="last"):
+    """shortest_path_grid before it was vectorized"""
+    SQRT2 = np.sqrt(2)
+    if start == "first":
+        matrix = np.flip(matrix, axis=0)
+    distances = np.zeros(matrix.shape)
+    for i in range(1, matrix.shape[0]):
+        for j in range(matrix.shape[1]):
+            local_dists = np.asarray([np.inf] * 3)
+            if j > 0:
+                local_dists[0] = SQRT2 * np.mean([matrix[i, j], matrix[i - 1, j - 1]]) + distances[i - 1, j - 1]
+            local_dists[1] = np.mean([matrix[i, j], matrix[i - 1, j]]) + distances[i - 1, j]
+            if j < (matrix.shape[1] - 1):
+                local_dists[2] = SQRT2 * np.mean([matrix[i, j], matrix[i - 1, j + 1]]) + distances[i - 1, j + 1]
+            distances[i, j] = min(local_dists)
+
+    shortest_paths = []
+    for j in range(matrix.shape[1]):
+        curr_j = j
+        shortest_paths.append([curr_j])
+        for i in range(matrix.shape[0] - 1, 0, -1):
+            local_dists = np.asarray([np.inf] * 3)
+            if curr_j > 0:
+                local_dists[0] = SQRT2 * np.mean([matrix[i, curr_j], matrix[i - 1, curr_j - 1]]) + distances[i - 1, curr_j - 1]
+            local_dists[1] = np.mean([matrix[i, curr_j], matrix[i - 1, curr_j]]) + distances[i - 1, curr_j]
+            if curr_j < (matrix.shape[1] - 1):
+                local_dists[2] = SQRT2 * np.mean([matrix[i, curr_j], matrix[i - 1, curr_j + 1]]) + distances[i - 1, curr_j + 1]
+            curr_j += -1 + np.argmin(local_dists)
+            shortest_paths[-1].append(curr_j)
+
+    if start == "first":
+        for l in shortest_paths:
+            l.reverse()
+    return shortest_paths
+
+
+def _grid_matrices():
+    rng = np.random.RandomState(3)
+    yield rng.uniform(0, 255, size=(25, 30))
+    # small integers and constant rows: many paths of the same length (ties)
+    yield rng.randint(0, 3, size=(20, 17)).astype(float)
+    yield np.ones((12, 9))
+    yield dists.dist_matrix(rng.uniform(0, 255, size=(18, 22)))
+    yield np.zeros((1, 5))
+    yield rng.uniform(0, 1, size=(6, 1))
+
+
+@pytest.mark.parametrize("start", ["last", "first"])
+def test_shortest_path_grid_same_as_loops(start):
+    for matrix in _grid_matrices():
+        expected = _shortest_path_grid_loops(matrix, start)
+        assert dists.shortest_path_grid(matrix, start) == expected
+        np.testing.assert_array_equal(dists.shortest_path_grid(matrix, start, as_list=False),
+                                      np.array(expected).reshape(matrix.shape[::-1]))
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import baseline1.process_image as proc
+from utils import dists
+from benchmarks import synthetic
+
+
+def _select_start_points_lists(final_segments, shape):
+    """select_start_points before the paths were kept in an integer array"""
+    valid_L_js, valid_R_js = [], []
+    L_distances, R_distances = [], []
+    img_len = shape[1]
+    half_img_len = img_len / 2
+    for segment in final_segments:
+        j = segment[-1]
+        if (np.abs(j - half_img_len) / img_len) > 0.2:
+            dist = (np.abs(j - half_img_len) / img_len)
+            if (j - half_img_len) < 0:
+                valid_L_js.append(j)
+                L_distances.append(dist)
+            else:
+                valid_R_js.append(j)
+                R_distances.append(dist)
+    left = [x for _, x in sorted(zip(L_distances, valid_L_js))]
+    right = [x for _, x in sorted(zip(R_distances, valid_R_js))]
+    return left[0], right[0]
+
+
+def _strong_paths_lists(M):
+    """Strong paths before they were matched by hashing"""
+    bottom_dist_mat = dists.dist_matrix(M[M.shape[0] // 2:, :])
+    paths_bottom = dists.shortest_path_grid(bottom_dist_mat, start="last")
+    paths_middle = dists.shortest_path_grid(bottom_dist_mat, start="first")
+    return [segment for segment in paths_bottom if segment in paths_middle]
+
+
+def _extrema_points_lists(shape, M):
+    """find_extrema_points2 before the strong paths were matched by hashing"""
+    final_segments = _strong_paths_lists(M)
+    left_start, right_start = _select_start_points_lists(final_segments, shape)
+    pel = proc.grow_segment(M, (M.shape[0] // 2, left_start))
+    per = proc.grow_segment(M, (M.shape[0] // 2, right_start))
+    pm = ((pel[0] + per[0]) // 2, (pel[1] + per[1]) // 2)
+    pt = (pm[0] // 2, pm[1])
+    return pel, pm, per, pt
+
+
+def _torso_gradient(seed):
+    img = proc.preprocess_img(synthetic.torso((384, 512), seed))[0]
+    return dists.color_gradient(img)
+
+
+def _strong_paths(M):
+    bottom_dist_mat = dists.dist_matrix(M[M.shape[0] // 2:, :])
+    paths_bottom = dists.shortest_path_grid(bottom_dist_mat, start="last", as_list=False)
+    paths_middle = dists.shortest_path_grid(bottom_dist_mat, start="first", as_list=False)
+    return paths_bottom[dists.common_paths(paths_bottom, paths_middle)]
+
+
+def test_strong_paths_same_as_lists():
+    rng = np.random.RandomState(0)
+    # random noise, and a flat image where every path is straight and strong
+    gradients = [_torso_gradient(0), rng.uniform(0, 255, size=(96, 128)), np.zeros((64, 80))]
+    for M in gradients:
+        expected = _strong_paths_lists(M)
+        strong = _strong_paths(M)
+        assert strong.tolist() == expected
+        assert proc.select_start_points(strong, M.shape) == _select_start_points_lists(expected, M.shape)
+
+
+def test_extrema_points_same_as_lists():
+    for seed in range(4):
+        M = _torso_gradient(seed)
+        assert proc.find_extrema_points2(M.shape, M, debug_verbose=False) == _extrema_points_lists(M.shape, M)
+
+
+def test_select_start_points_ties():
+    shape = (10, 100)
+    # columns 20 and 80 are both 0.3 from the center, 10 and 90 further
+    segments = [[5, 20], [0, 10], [1, 20], [3, 80], [2, 90], [7, 80]]
+    assert proc.select_start_points(np.array(segments), shape) == \
+        _select_start_points_lists(segments, shape) == (20, 80)
+
+
+def test_breast_contours_of_extrema_points():
+    M = _torso_gradient(1)
+    pl, pm, pr, _ = _extrema_points_lists(M.shape, M)
+    new_pl, new_pm, new_pr, _ = proc.find_extrema_points2(M.shape, M, debug_verbose=False)
+    for (a, b), (new_a, new_b) in [((pl, pm), (new_pl, new_pm)), ((pm, pr), (new_pm, new_pr))]:
+        np.testing.assert_array_equal(proc.breast_contour(M, new_a, new_b, debug_verbose=False),
+                                      proc.breast_contour(M, a, b, debug_verbose=False))
@@ -0,0 +1,115 @@
+import cv2
+import numpy as np
+
+from baseline2.generator import Generator, translate_points, rotate_points
+from benchmarks import synthetic
+
+SHAPE = (384, 512)
+
+
+class _LoopGenerator(Generator):
+    """Augmentations of Generator before they were vectorized (they draw from np.random)"""
+
+    def flip(self):
+        indices = self._random_indices(self.flip_ratio)
+        self.inputs[indices] = self.inputs[indices, :, ::-1, :]
+        if not self.render_heatmaps:
+            self.mask[indices] = self.mask[indices, :, ::-1]
+        self.targets[indices, ::2] = 1 - self.targets[indices, ::2]
+        for a, b in self.flip_indices:
+            self.targets[indices, a], self.targets[indices, b] = (self.targets[indices, b], self.targets[indices, a])
+
+    def translation(self):
+        indices = self._random_indices(self.translation_ratio)
+        tx = np.random.randint(-50, 50)
+        ty = np.random.randint(-30, 30)
+        x_t = self.targets[indices, ::2]
+        y_t = self.targets[indices, 1::2]
+        for i in range(np.shape(x_t)[0]):
+            x_t[i] = translate_points(x_t[i], tx / 512)
+            y_t[i] = translate_points(y_t[i], ty / 512)
+        self.targets[indices, ::2] = x_t
+        self.targets[indices, 1::2] = y_t
+
+        image = self.inputs[indices, :, :, :]
+        if not self.render_heatmaps:
+            mask = self.mask[indices, :, :]
+            for i in range(np.shape(mask)[0]):
+                mask[i, :, :, 0] = cv2.warpAffine(mask[i, :, :, 0], np.float32([[1, 0, tx], [0, 1, ty]]), (512, 384))
+            self.mask[indices] = np.reshape(mask, (-1, 384, 512, 1))
+        for i in range(np.shape(image)[0]):
+            for j in range(3):
+                image[i, :, :, j] = cv2.warpAffine(image[i, :, :, j], np.float32([[1, 0, tx], [0, 1, ty]]), (512, 384))
+        self.inputs[indices, :, :, :] = image
+
+    def rotate(self):
+        indices = self._random_indices(self.rotate_ratio)
+        angle = np.random.randint(-10, 10)
+        M = cv2.getRotationMatrix2D((512 / 2, 384 / 2), angle, 1)
+        for i in indices:
+            for j in range(3):
+                self.inputs[i, :, :, j] = cv2.warpAffine(self.inputs[i, :, :, j], M, (512, 384))
+            if not self.render_heatmaps:
+                self.mask[i, :, :, 0] = cv2.warpAffine(self.mask[i, :, :, 0], M, (512, 384))
+        # the targets of all the images were rotated
+        for i in range(np.shape(self.targets)[0]):
+            x, y = rotate_points((256 / 512, 192 / 512), (self.targets[i][0:74:2], self.targets[i][1:75:2]),
+                                 (-angle * 2 * np.pi) / 360)
+            self.targets[i][0:74:2] = x
+            self.targets[i][1:75:2] = y
+
+
+def _data(n=6):
+    rng = np.random.RandomState(0)
+    X = rng.uniform(0, 255, size=(n,) + SHAPE + (3,)).astype(np.float32)
+    masks = rng.uniform(0, 1, size=(n,) + SHAPE + (1,)).astype(np.float32)
+    Y = np.stack([synthetic.keypoints(SHAPE, seed) for seed in range(n)]) / SHAPE[1]
+    return X, masks, Y
+
+
+def _generators(data, **kwargs):
+    return _LoopGenerator(*data, **kwargs), Generator(*data, **kwargs)
+
+
+def _assert_batches_equal(old, new):
+    np.testing.assert_array_equal(new[0], old[0])
+    np.testing.assert_array_equal(new[1]['heatmaps'], old[1]['heatmaps'])
+    np.testing.assert_allclose(new[1]['keypoints'], old[1]['keypoints'], rtol=0, atol=1e-15)
+
+
+def test_batch_same_as_loops():
+    data = _data()
+    old, new = _generators(data, flip_ratio=0.5, translation_ratio=0.5)
+    for seed in range(4):
+        np.random.seed(seed)
+        old_batch = old.make_batch(slice(0, 6))
+        new_batch = new.make_batch(slice(0, 6), rng=np.random.RandomState(seed))
+        _assert_batches_equal(old_batch, new_batch)
+
+
+def _rotated(gen, data, rng=None):
+    gen.rng = np.random if rng is None else rng
+    gen.inputs, gen.mask, gen.targets = [np.array(array) for array in data]
+    gen.actual_batchsize = len(gen.inputs)
+    gen.rotate()
+    return gen.inputs, {'heatmaps': gen.mask, 'keypoints': gen.targets}
+
+
+def test_rotate_same_as_loops():
+    data = _data()
+    old, new = _generators(data, rotate_ratio=1.0)
+    for seed in range(3):
+        np.random.seed(seed)
+        _assert_batches_equal(_rotated(old, data), _rotated(new, data, np.random.RandomState(seed)))
+
+    # only the targets of the rotated images change now
+    old, new = _generators(data, rotate_ratio=0.5)
+    np.random.seed(0)
+    old_batch = _rotated(old, data)
+    new_batch = _rotated(new, data, np.random.RandomState(0))
+    indices = np.random.RandomState(0).choice(6, 3, replace=False)
+    others = np.setdiff1d(np.arange(6), indices)
+    np.testing.assert_array_equal(new_batch[0], old_batch[0])
+    np.testing.assert_allclose(new_batch[1]['keypoints'][indices], old_batch[1]['keypoints'][indices],
+                               rtol=0, atol=1e-15)
+    np.testing.assert_array_equal(new_batch[1]['keypoints'][others], data[2][others])
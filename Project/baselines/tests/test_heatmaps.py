@@ -0,0 +1,71 @@
+import math
+import cv2
+import numpy as np
+
+from baseline2 import heatmaps
+from benchmarks import synthetic
+
+
+def _get_pdf(im, kpts, sigma):
+    """get_pdf of 2_heatmap_generation, before render (sigma is the variance)"""
+    w, h, channels = im.shape
+    x = np.linspace(0, h - 1, h * 1)
+    y = np.linspace(0, w - 1, w * 1)
+    [XX, YY] = np.meshgrid(y, x)
+    sze = XX.shape[0] * XX.shape[1]
+    mvg = np.zeros((sze))
+    std = sigma
+    p = 2
+    for i in range(0, 37):
+        mu = np.array([kpts[i][1], kpts[i][0]]).reshape((2, 1))
+        mu = np.tile(mu, (1, sze))
+        mcov = np.identity(2) * std
+        X = np.array([np.ravel(XX.T), np.ravel(YY.T)])
+        temp0 = 1 / (math.pow(2 * math.pi, p / 2) * math.pow(np.linalg.det(mcov), 0.5))
+        temp1 = -0.5 * (X - mu).T
+        temp2 = np.linalg.inv(mcov).dot(X - mu)
+        temp3 = temp0 * np.exp(np.sum(temp1 * temp2.T, axis=1))
+        maximum = max(temp3.ravel())
+        mvg = mvg + temp3
+        mvg[mvg > maximum] = maximum
+    mvg = mvg.reshape((XX.shape[1], XX.shape[0]))
+    mvg = (mvg - min(mvg.ravel())) / (max(mvg.ravel()) - min(mvg.ravel()))
+    mvg = mvg * 255.0
+    mvg = cv2.resize(mvg, (h, w), interpolation=cv2.INTER_CUBIC)
+    mvg = mvg / 255.0
+    mvg[mvg < 0] = 0
+    return mvg
+
+
+def _keypoints(shape, seed):
+    # get_pdf received the keypoints truncated to integers
+    return synthetic.keypoints(shape, seed).reshape([-1, 2]).astype(int)
+
+
+def test_render_same_as_get_pdf():
+    for shape, sigma in [((96, 128), 5), ((96, 128), 20), ((384, 512), 20)]:
+        keypoints = _keypoints(shape, 0)
+        expected = _get_pdf(np.zeros(shape + (3,)), keypoints, sigma ** 2)
+        heatmap = heatmaps.render(keypoints, shape=shape, sigma=sigma, truncate=None, dtype=np.float64)
+        np.testing.assert_allclose(heatmap, expected, rtol=0, atol=1e-12)
+
+
+def test_render_truncated():
+    # with the image size and sigma of 2_heatmap_generation, the default window
+    # ignores tails below 1% of the peak
+    shape = (384, 512)
+    for seed in range(2):
+        keypoints = _keypoints(shape, seed)
+        expected = _get_pdf(np.zeros(shape + (3,)), keypoints, 20 ** 2)
+        heatmap = heatmaps.render(keypoints, shape=shape, sigma=20, dtype=np.float64)
+        assert np.abs(heatmap - expected).max() < 0.05
+
+
+def test_render_batch():
+    shape = (96, 128)
+    keypoints = np.stack([_keypoints(shape, seed) for seed in range(3)])
+    out = np.full((3,) + shape, np.nan, dtype=np.float16)
+    assert heatmaps.render_batch(keypoints, shape=shape, sigma=5, out=out) is out
+    for i in range(3):
+        np.testing.assert_allclose(out[i], heatmaps.render(keypoints[i], shape=shape, sigma=5),
+                                   atol=1e-3)
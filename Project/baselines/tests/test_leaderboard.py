@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from utils import leaderboard
+
+
+class _SerialExecutor:
+    """ProcessPoolExecutor running in the test process"""
+
+    def __init__(self, max_workers=None, initializer=None, initargs=()):
+        initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def map(self, function, iterable):
+        return list(map(function, iterable))
+
+
+@pytest.fixture
+def scored(monkeypatch):
+    """Paths scored, submissions whose file contains 'invalid' get nan scores"""
+    paths = []
+
+    def score_submission(path):
+        paths.append(path)
+        with open(path) as f:
+            if "invalid" in f.read():
+                return [float("nan")] * len(leaderboard.TASK_WEIGHTS)
+        return [1.0, 2.0, 3.0]
+
+    monkeypatch.setattr(leaderboard, "ProcessPoolExecutor", _SerialExecutor)
+    monkeypatch.setattr(leaderboard, "score_submission", score_submission)
+    monkeypatch.setattr(leaderboard.scoring, "ground_truth_splines", lambda *args: None)
+    return paths
+
+
+def _submission(folder, team, content):
+    (folder / team).mkdir()
+    path = folder / team / "predictions.csv"
+    path.write_text(content)
+    return str(path)
+
+
+def test_nan_scores_are_not_cached(tmp_path, scored):
+    ground_truth, shapes = np.zeros([2, 74]), [(10, 10)] * 2
+    cache = str(tmp_path / "cache.json")
+    submissions = {"a": _submission(tmp_path, "a", "valid"),
+                   "b": _submission(tmp_path, "b", "invalid")}
+
+    results = leaderboard.evaluate(submissions, ground_truth, shapes, cache_path=cache)
+    assert results["a"] == [leaderboard.weighted_error([1.0, 2.0, 3.0]), 1.0, 2.0, 3.0]
+    assert np.all(np.isnan(results["b"]))
+    assert sorted(scored) == sorted(submissions.values())
+
+    # only the invalid submission is scored again
+    del scored[:]
+    results = leaderboard.evaluate(submissions, ground_truth, shapes, cache_path=cache)
+    assert scored == [submissions["b"]]
+    assert results["a"][1:] == [1.0, 2.0, 3.0]
+
+
+def test_duplicate_teams(tmp_path):
+    first = _submission(tmp_path, "team", "")
+    (tmp_path / "other").mkdir()
+    second = _submission(tmp_path / "other", "team", "")
+    assert leaderboard.submission_teams([first, first]) == {"team": first}
+    with pytest.raises(ValueError):
+        leaderboard.submission_teams([first, second])
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import scipy.ndimage as ndimage
+
+import baseline1.process_image as proc
+from utils import dists
+from benchmarks import synthetic
+
+
+def _old_breast_mask(shape, breast):
+    """get_breast_mask before the masks were rasterized with cv2.fillPoly"""
+    mask = np.zeros(shape)
+    x, y = dists.spline(breast, n_points=8000)
+    x = np.clip(np.round(x).astype(int), 0, mask.shape[0] - 1)
+    y = np.clip(np.round(y).astype(int), 0, mask.shape[1] - 1)
+    mask[x, y] = 1
+    x = np.clip(np.linspace(breast[0, 0], breast[-1, 0], 2000), 0, mask.shape[0] - 1)
+    y = np.clip(np.linspace(breast[0, 1], breast[-1, 1], 2000), 0, mask.shape[1] - 1)
+    mask[np.round(x).astype(int), np.round(y).astype(int)] = 1
+    return ndimage.binary_fill_holes(mask)
+
+
+def _synthetic_breasts(n=5, shape=(384, 512)):
+    for seed in range(n):
+        points = synthetic.keypoints(shape, seed).reshape([-1, 2])
+        # (row, col) contours, as returned by breast_contour
+        yield np.flip(points[0:17], axis=1)
+        yield np.flip(points[17:34], axis=1)
+
+
+def _noisy_breast(rng, noise=2.0):
+    """Contour from lateral to medial below its end points, that does not cross itself"""
+    t = np.linspace(np.pi, 0, 17)
+    radius = rng.uniform(30, 60)
+    center = rng.uniform([60, 80], [100, 180])
+    breast = np.stack([center[0] + radius * np.sin(t), center[1] + radius * np.cos(t)], axis=1)
+    return breast + rng.normal(0, noise, breast.shape)
+
+
+def test_mask_same_as_fill_holes_on_smooth_contours():
+    shape = (384, 512)
+    for breast in _synthetic_breasts():
+        np.testing.assert_array_equal(proc.get_breast_mask(shape, breast, debug_verbose=False),
+                                      _old_breast_mask(shape, breast))
+
+
+def test_mask_differs_from_fill_holes_only_along_the_closing_line():
+    rng = np.random.RandomState(0)
+    shape = (200, 260)
+    different = []
+    for _ in range(50):
+        breast = _noisy_breast(rng)
+        new = proc.get_breast_mask(shape, breast, debug_verbose=False)
+        old = _old_breast_mask(shape, breast)
+        rows, cols = np.nonzero(new != old)
+        different.append(len(rows))
+        # distance of the differing pixels to the line between the extrema
+        start, end = breast[0], breast[-1]
+        direction = (end - start) / np.linalg.norm(end - start)
+        distance = np.abs((rows - start[0]) * direction[1] - (cols - start[1]) * direction[0])
+        assert np.all(distance <= 1.5)
+    # the lines are rasterized differently: a few pixels differ on most contours
+    assert 0 < np.median(different) < 50
+
+
+def test_mask_with_precomputed_contour():
+    shape = (384, 512)
+    for breast in _synthetic_breasts(2):
+        contour = proc.breast_spline(shape, breast)
+        mask, offset = proc.get_breast_mask_roi(shape, breast, border=1)
+        mask_contour, offset_contour = proc.get_breast_mask_roi(shape, breast, contour=contour, border=1)
+        assert offset == offset_contour
+        np.testing.assert_array_equal(mask, mask_contour)
+        np.testing.assert_array_equal(proc.get_breast_mask(shape, breast, False, contour=contour),
+                                      proc.get_breast_mask(shape, breast, False))
@@ -0,0 +1,48 @@
+import os
+import numpy as np
+import scipy.ndimage as ndimage
+
+import baseline1.process_image as proc
+from utils import dists
+from benchmarks import synthetic
+
+
+def _nipple_full_image(img, boundary, nipple_params):
+    """nipple before the probability images were vectorized and cropped to the breast"""
+    means = nipple_params[0, :]
+    stds = nipple_params[1, :]
+    breast_mask = proc.get_breast_mask([*img.shape[0:2]], boundary, debug_verbose=False)
+
+    x, y = np.nonzero(breast_mask)
+    mid_point = (boundary[0] + boundary[-1]) / 2
+    angle_image = np.zeros(breast_mask.shape)
+    for i in range(x.shape[0]):
+        vec = (x[i], y[i]) - mid_point
+        angle_image[x[i], y[i]] = np.arctan2(vec[0], vec[1])
+    angle_prob = dists.normal_prob(angle_image, means[0], stds[0])
+
+    distance_image = ndimage.distance_transform_edt(breast_mask)
+    dist_prob = dists.normal_prob(distance_image, means[1], stds[1])
+
+    mean_color = np.asarray([np.average(img[:, :, c], weights=breast_mask) for c in range(3)])
+    color_image = img - mean_color
+    color_prob = sum(dists.normal_prob(color_image[:, :, c], means[2 + c], stds[2 + c])
+                     for c in range(3)) / 3
+
+    prob = angle_prob * dist_prob * color_prob * breast_mask
+    return np.unravel_index(np.argmax(prob), prob.shape)
+
+
+def test_nipple_same_as_full_image(tmp_path):
+    synthetic.write_models(str(tmp_path))
+    nipple_params = np.load(os.path.join(str(tmp_path), "left_nipple_params.npy"))
+    shape = (384, 512)
+    rng = np.random.RandomState(0)
+    for seed in range(4):
+        img = proc.preprocess_img(synthetic.torso(shape, seed))[0]
+        points = synthetic.keypoints(shape, seed).reshape([-1, 2])
+        for boundary in (np.flip(points[0:17], axis=1), np.flip(points[17:34], axis=1)):
+            # the synthetic models, and random ones
+            for params in (nipple_params, nipple_params * rng.uniform(0.5, 1.5, size=nipple_params.shape)):
+                expected = _nipple_full_image(img, boundary, params)
+                assert proc.nipple(img, boundary, params, debug_verbose=False) == expected
@@ -0,0 +1,79 @@
+import pickle
+import numpy as np
+import pytest
+
+pytest.importorskip("keras")
+from baseline2.predict import iter_images, save_image_stream
+
+
+def _images(n=3, shape=(20, 30, 3)):
+    rng = np.random.RandomState(0)
+    return [rng.randint(0, 256, size=shape, dtype=np.uint8) for _ in range(n)]
+
+
+def _pickle(tmp_path, *items):
+    path = tmp_path / "images.pickle"
+    with open(path, "wb") as f:
+        for item in items:
+            pickle.dump(item, f)
+    return str(path)
+
+
+def test_iter_images_object_array(tmp_path):
+    images = _images()
+    # images of different sizes are stored as an object array
+    images[1] = images[1][:15]
+    array = np.empty(len(images), dtype=object)
+    array[:] = images
+    result = list(iter_images(_pickle(tmp_path, array)))
+    assert len(result) == len(images)
+    for image, expected in zip(result, images):
+        np.testing.assert_array_equal(image, expected)
+
+
+def test_iter_images_stacked_array(tmp_path):
+    images = np.stack(_images())
+    result = list(iter_images(_pickle(tmp_path, images)))
+    assert len(result) == len(images)
+    np.testing.assert_array_equal(np.stack(result), images)
+
+
+def test_iter_images_list_and_stream(tmp_path):
+    images = _images(4)
+    result = list(iter_images(_pickle(tmp_path, images[:2], images[2], images[3])))
+    assert len(result) == 4
+    for image, expected in zip(result, images):
+        np.testing.assert_array_equal(image, expected)
+
+
+def test_iter_images_npy_is_memory_mapped(tmp_path):
+    images = np.stack(_images())
+    path = str(tmp_path / "images.npy")
+    np.save(path, images)
+    result = list(iter_images(path))
+    assert len(result) == len(images)
+    assert all(isinstance(image, np.memmap) for image in result)
+    np.testing.assert_array_equal(np.stack(result), images)
+
+
+def test_iter_images_npy_of_objects(tmp_path):
+    array = np.empty(2, dtype=object)
+    array[:] = _images(2)
+    path = str(tmp_path / "images.npy")
+    np.save(path, array, allow_pickle=True)
+    with pytest.raises(ValueError):
+        list(iter_images(path))
+
+
+def test_save_image_stream(tmp_path):
+    images = _images(4)
+    images[2] = images[2][:10]
+    path = str(tmp_path / "stream.pickle")
+    assert save_image_stream(iter_images(_pickle(tmp_path, images)), path) == 4
+    # one record per image
+    with open(path, "rb") as f:
+        assert isinstance(pickle.load(f), np.ndarray)
+    result = list(iter_images(path))
+    assert len(result) == 4
+    for image, expected in zip(result, images):
+        np.testing.assert_array_equal(image, expected)
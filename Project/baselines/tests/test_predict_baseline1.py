@@ -0,0 +1,48 @@
+import time
+import numpy as np
+import pytest
+
+import baseline1.model as model
+import baseline1.predict as predict
+import baseline1.registry as registry
+from benchmarks import synthetic
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    synthetic.write_models(str(tmp_path))
+    registry.clear()
+    registry.load(str(tmp_path))
+    yield str(tmp_path)
+    registry.clear()
+
+
+def test_predict_image_timeout_race(models_dir, monkeypatch):
+    """The alarm can go off inside model.test or just after it returns, it never escapes"""
+    img = np.zeros((384, 512, 3), dtype=np.uint8)
+    mean = registry.get_model("mean_model")
+    detections = np.ones(74)
+    rng = np.random.RandomState(0)
+    durations = rng.uniform(0, 2e-4, size=300)
+
+    def fake_test(img, **kwargs):
+        end = time.perf_counter() + durations[fake_test.calls]
+        fake_test.calls += 1
+        while time.perf_counter() < end:
+            pass
+        return detections
+    fake_test.calls = 0
+    monkeypatch.setattr(model, "test", fake_test)
+
+    outcomes = set()
+    for _ in durations:
+        result, timed_out, _, _ = predict.predict_image(img, timeout=1e-4)
+        expected = mean if timed_out else detections
+        np.testing.assert_array_equal(result, expected)
+        outcomes.add(timed_out)
+    assert outcomes == {True, False}
+
+
+def test_model_test_is_quiet(models_dir, capsys):
+    model.test(synthetic.torso((384, 512)), testing=True, time_debug=False)
+    assert capsys.readouterr().out == ""
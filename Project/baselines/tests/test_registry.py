@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pytest
+
+import baseline1.registry as registry
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    for value, name in enumerate(registry.MODEL_NAMES):
+        np.save(str(tmp_path / (name + ".npy")), np.full(3, value, dtype=float))
+    registry.clear()
+    yield str(tmp_path)
+    registry.clear()
+
+
+def _touch(models_dir, value):
+    path = os.path.join(models_dir, "mean_model.npy")
+    np.save(path, np.full(3, value))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+
+
+def test_get_models_reads_files_once(models_dir, monkeypatch):
+    monkeypatch.setattr(registry, "CHECK_INTERVAL", 3600)
+    models = registry.load(models_dir)
+    stats = []
+    real_stat = os.stat
+    monkeypatch.setattr(os, "stat", lambda *args, **kwargs: stats.append(args) or real_stat(*args, **kwargs))
+    for _ in range(3):
+        assert registry.get_models() is models
+    assert stats == []
+    assert not models["mean_model"].flags.writeable
+
+
+def test_load_reads_changed_files(models_dir, monkeypatch):
+    monkeypatch.setattr(registry, "CHECK_INTERVAL", 3600)
+    before = registry.load(models_dir)
+    assert registry.load() is before
+    _touch(models_dir, 10.0)
+    # get_models keeps the cached models until the next check, load reads the new ones
+    assert registry.get_models() is before
+    np.testing.assert_array_equal(registry.load()["mean_model"], 10.0)
+    np.testing.assert_array_equal(registry.get_model("mean_model"), 10.0)
+
+
+def test_get_models_reads_changed_files_after_interval(models_dir, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(registry.time, "monotonic", lambda: now[0])
+    before = registry.load(models_dir)
+    _touch(models_dir, 10.0)
+    now[0] += registry.CHECK_INTERVAL / 2
+    assert registry.get_models() is before
+    now[0] += registry.CHECK_INTERVAL
+    np.testing.assert_array_equal(registry.get_models()["mean_model"], 10.0)
+    # unchanged files are not read again
+    after = registry.get_models()
+    now[0] += registry.CHECK_INTERVAL
+    assert registry.get_models() is after
@@ -0,0 +1,53 @@
+import numpy as np
+
+from baseline2 import resize_images
+from benchmarks import synthetic
+
+
+def _resize_keypoints_to_original_size_loops(keypoint_predictions, X_original):
+    """resize_keypoints_to_original_size before it took the original shapes"""
+    X_original = np.array(X_original)
+    keypoint_predictions = np.array(keypoint_predictions)
+    final_predictions = []
+    for i in range(X_original.shape[0]):
+        rows, columns, channels = np.shape(X_original[i])
+        x1 = rows / 1536
+        x2 = columns / 2048
+        for j in range(74):
+            if j % 2 == 0:
+                keypoint_predictions[i][j] *= x2
+            else:
+                keypoint_predictions[i][j] *= x1
+        final_predictions.append(keypoint_predictions[i] * 4)
+    return final_predictions
+
+
+def test_resize_keypoints_to_original_size_same_as_loops():
+    rng = np.random.RandomState(0)
+    # the old function needed images of the same size
+    for orig_shape in synthetic.SIZES + [(1000, 1500), (333, 517)]:
+        images = np.zeros((2,) + orig_shape + (3,), dtype=np.uint8)
+        predictions = rng.uniform(0, 512, size=(2, 74))
+        expected = _resize_keypoints_to_original_size_loops(predictions, images)
+        orig_shapes = [image.shape for image in images]
+        np.testing.assert_allclose(resize_images.resize_keypoints_to_original_size(predictions, orig_shapes),
+                                   expected, rtol=1e-13)
+
+
+def test_resize_keypoints_inverse():
+    rng = np.random.RandomState(1)
+    orig_shapes = [(1536, 2048, 3), (1000, 1500, 3), (333, 517, 3)]
+    keypoints = np.stack([synthetic.keypoints(shape[0:2], i) for i, shape in enumerate(orig_shapes)])
+    resized = resize_images.resize_keypoints(keypoints, orig_shapes)
+    # (x, y) pairs of the resized keypoints are in the same place relative to the image
+    relative = resized.reshape([-1, 37, 2]) / [resize_images.RESIZED_SHAPE[1], resize_images.RESIZED_SHAPE[0]]
+    orig_size = np.array([[shape[1], shape[0]] for shape in orig_shapes])[:, np.newaxis]
+    np.testing.assert_allclose(relative, keypoints.reshape([-1, 37, 2]) / orig_size, rtol=1e-13)
+    np.testing.assert_allclose(resize_images.resize_keypoints_to_original_size(resized, orig_shapes),
+                               keypoints, rtol=1e-13)
+    # the images can have different sizes
+    predictions = rng.uniform(0, 512, size=(3, 74))
+    result = resize_images.resize_keypoints_to_original_size(predictions, orig_shapes)
+    for i, shape in enumerate(orig_shapes):
+        np.testing.assert_allclose(result[i], _resize_keypoints_to_original_size_loops(
+            predictions[i:i + 1], [np.zeros(shape, dtype=np.uint8)])[0], rtol=1e-13)
@@ -0,0 +1,45 @@
+import numpy as np
+from shapely.geometry import LineString, Point
+
+from utils import scoring
+from benchmarks import synthetic
+
+
+def _predictions(n=12, seed=0):
+    rng = np.random.RandomState(seed)
+    shapes = [synthetic.SIZES[i % 2] + (3,) for i in range(n)]
+    ground_truth = np.stack([synthetic.keypoints(shape[0:2], i) for i, shape in enumerate(shapes)])
+    # small and large errors, and a prediction equal to the ground truth
+    noise = rng.normal(0, 1, ground_truth.shape) * rng.choice([0.5, 5, 40], size=[n, 1])
+    noise[0] = 0
+    return ground_truth + noise, ground_truth, shapes
+
+
+def test_generate_scores_same_as_shapely():
+    predictions, ground_truth, shapes = _predictions()
+    expected = [scoring.measure_distances(p, g, s) for p, g, s in zip(predictions, ground_truth, shapes)]
+    scores = scoring.generate_scores(predictions, ground_truth, shapes)
+    assert len(scores) == len(expected)
+    np.testing.assert_allclose(scores, expected, rtol=0, atol=1e-15)
+
+
+def test_score_batch_with_ground_truth_curves():
+    predictions, ground_truth, shapes = _predictions(seed=1)
+    curves = scoring.ground_truth_splines(ground_truth, shapes)
+    scores = scoring.score_batch(predictions, ground_truth, shapes)
+    np.testing.assert_array_equal(scoring.score_batch(predictions, ground_truth, shapes,
+                                                      ground_truth_curves=curves), scores)
+    np.testing.assert_array_equal(scores['breast'], [s[0] for s in scoring.generate_scores(predictions, ground_truth, shapes)])
+
+
+def test_point_to_polyline_distance_same_as_shapely():
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        # random walks, with repeated vertices (degenerate segments)
+        polyline = np.cumsum(rng.normal(0, 5, size=(rng.randint(2, 60), 2)), axis=0)
+        polyline = np.repeat(polyline, rng.randint(1, 3, size=len(polyline)), axis=0)
+        points = np.concatenate([rng.uniform(-50, 50, size=(30, 2)), polyline[::3]])
+        line = LineString(polyline)
+        expected = [line.distance(Point(point)) for point in points]
+        np.testing.assert_allclose(scoring.point_to_polyline_distance(points, polyline), expected,
+                                   rtol=1e-12, atol=1e-12)
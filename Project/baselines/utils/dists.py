@@ -1,7 +1,10 @@
 import cv2
+import heapq
+import math
 import numpy as np
 import skimage.filters
 from utils.priodict import priorityDictionary
+from utils import profiler
 from shapely.geometry import Polygon,Point
 import scipy.interpolate as interpolate
 import numpy
@@ -107,13 +110,8 @@ def shortestPath(G,start,end):
     return Path
 
    
-def dist_with_prior(weight,u,v):
+def dist_with_prior(weight,u,v,alpha=0.15,beta=0.25,delta=1.85,beta2=3):
     
-    alpha = 0.15
-    beta = 0.25
-    delta = 1.85
-    beta2 = 3
-
     M,transformed_model = weight
     prior = max(transformed_model[u],transformed_model[v])
     
@@ -152,10 +150,279 @@ _______________________________________________________________________________
 _______________________________________________________________________________
 """
 
+# 8-neighbourhood of a pixel, in the same order used by build_graph(direction="all")
+GRID_NEIGHBOURS = [(0,-1),(1,-1),(1,0),(1,1),(0,1),(-1,1),(-1,0),(-1,-1)]
+
+def grid_shortest_path(edge_weights, start, end_points, subimage, astar_delta=None):
+    """
+    Find the shortest path between start and the closest of end_points on the
+    8-connected pixel grid limited by subimage = [top, left, bottom, right].
+    
+    edge_weights[k,i,j] is the weight of the edge between pixel (top+i,left+j)
+    and its neighbour in direction GRID_NEIGHBOURS[k], as returned by
+    edge_weights_with_prior or edge_weights_from_matrix.
+    
+    The result is the same as
+        shortestPath(build_graph(weight, end_points, "all", subimage, dist_func),
+                     start, end_point_flag)[0:-1]
+    but no graph is built: vertices are flat pixel indices kept in a binary heap.
+    Ties are broken by pixel coordinates, as in priorityDictionary, so the same 
+    path is returned.
+    
+    If astar_delta is given the search runs as A*, guided by astar_delta times 
+    the Euclidean distance to the closest end point. This is admissible as long 
+    as astar_delta is a lower bound of the edge weight per unit length (e.g. 
+    delta in dist_with_prior).
+    
+    The output is a list of the vertices (i,j) in order along the shortest path.
+    """
+    top, left, bottom, right = subimage
+    width = right-left
+    n_vertices = (bottom-top)*width
+    # The weights of each expanded vertex are converted to Python floats, much faster 
+    # than numpy scalars in the inner loop (converting all of them takes more memory
+    # than the rest of the search, and most vertices are never expanded)
+    weights = np.asarray(edge_weights).reshape([len(GRID_NEIGHBOURS), n_vertices])
+    
+    def flat(p):
+        return (p[0]-top)*width + (p[1]-left)
+    
+    targets = set(flat(p) for p in end_points)
+    if astar_delta is None:
+        heuristic = lambda i,j: 0
+    else:
+        def heuristic(i,j):
+            return astar_delta*min(math.hypot(p[0]-i,p[1]-j) for p in end_points)
+    
+    D = [np.inf]*n_vertices       # best known distances
+    P = [-1]*n_vertices           # predecessors
+    final = bytearray(n_vertices) # vertices with a final distance
+    
+    source = flat(start)
+    D[source] = 0
+    heap = [(heuristic(*start), source)]
+    pushes = 1
+    expanded = 0
+    end = None
+    while heap:
+        _, v = heapq.heappop(heap)
+        if final[v]:
+            continue
+        final[v] = 1
+        expanded += 1
+        if v in targets:
+            end = v
+            break
+        
+        i, j = divmod(v, width)
+        i += top
+        j += left
+        v_weights = weights[:,v].tolist()
+        for k,(di,dj) in enumerate(GRID_NEIGHBOURS):
+            wi, wj = i+di, j+dj
+            if wi<top or wi>=bottom or wj<left or wj>=right:
+                continue
+            w = v + di*width + dj
+            if final[w]:
+                continue
+            vwLength = D[v] + v_weights[k]
+            if vwLength < D[w]:
+                D[w] = vwLength
+                P[w] = v
+                heapq.heappush(heap, (vwLength+heuristic(wi,wj), w))
+                pushes += 1
+    profiler.count("heap_pushes", pushes)
+    profiler.count("expanded", expanded)
+    
+    if end is None:
+        raise ValueError("grid_shortest_path: no end point is reachable from start")
+    
+    path = []
+    while end != -1:
+        i, j = divmod(end, width)
+        path.append((i+top, j+left))
+        end = P[end]
+    path.reverse()
+    return path
+
+def bidirectional_grid_shortest_path(edge_weights, start, end_points, subimage):
+    """
+    Same as grid_shortest_path, searching at the same time from start (forward)
+    and from end_points (backward, along the reversed edges) until the two 
+    searches meet.
+    
+    The side whose heap has the smallest key is expanded. Every edge relaxed
+    between a vertex of one search and a vertex reached by the other one gives
+    a candidate path, and the search stops when the sum of the smallest keys of 
+    the two heaps is not lower than the best candidate: any other path would 
+    have to cross a vertex that is not final in either search and cannot be 
+    shorter. The result is a shortest path, although not always the same as 
+    grid_shortest_path when several paths have the same length.
+    
+    Each search only has to reach about half the distance between the end
+    points. The number of expanded vertices (of both searches) is counted in 
+    the profiler as "expanded", as in grid_shortest_path.
+    """
+    top, left, bottom, right = subimage
+    width = right-left
+    n_vertices = (bottom-top)*width
+    edge_weights = np.asarray(edge_weights)
+    # the edge from a neighbour in direction k back to the pixel has direction opposite[k],
+    # its weights are shifted so that the backward search reads them at the pixel
+    opposite = [GRID_NEIGHBOURS.index((-di,-dj)) for di,dj in GRID_NEIGHBOURS]
+    h, w = edge_weights.shape[1:]
+    padded = np.pad(edge_weights, ((0,0),(1,1),(1,1)), mode="constant", constant_values=np.inf)
+    reverse_weights = np.stack([padded[opposite[k],1+di:1+di+h,1+dj:1+dj+w]
+                                for k,(di,dj) in enumerate(GRID_NEIGHBOURS)])
+    # weights of the edges followed by each search, converted to Python floats for
+    # each expanded vertex (see grid_shortest_path)
+    weights = (edge_weights.reshape([len(GRID_NEIGHBOURS), n_vertices]),
+               reverse_weights.reshape([len(GRID_NEIGHBOURS), n_vertices]))
+    
+    def flat(p):
+        return (p[0]-top)*width + (p[1]-left)
+    
+    source = flat(start)
+    targets = set(flat(p) for p in end_points)
+    if source in targets:
+        return [start]
+    
+    # index 0: forward search from start, index 1: backward search from end_points
+    D = ([np.inf]*n_vertices, [np.inf]*n_vertices)
+    P = ([-1]*n_vertices, [-1]*n_vertices)
+    final = (bytearray(n_vertices), bytearray(n_vertices))
+    D[0][source] = 0
+    for t in targets:
+        D[1][t] = 0
+    heaps = ([(0, source)], [(0, t) for t in sorted(targets)])
+    heapq.heapify(heaps[1])
+    pushes = 1+len(targets)
+    expanded = 0
+    best = np.inf
+    meeting = None   # (vertex of the forward search, vertex of the backward search)
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        _, v = heapq.heappop(heaps[side])
+        if final[side][v]:
+            continue
+        final[side][v] = 1
+        expanded += 1
+        D_side, D_other, P_side = D[side], D[1-side], P[side]
+        
+        i, j = divmod(v, width)
+        i += top
+        j += left
+        v_weights = weights[side][:,v].tolist()
+        for k,(di,dj) in enumerate(GRID_NEIGHBOURS):
+            wi, wj = i+di, j+dj
+            if wi<top or wi>=bottom or wj<left or wj>=right:
+                continue
+            w = v + di*width + dj
+            vwLength = D_side[v] + v_weights[k]
+            if vwLength + D_other[w] < best:
+                best = vwLength + D_other[w]
+                meeting = (v, w) if side == 0 else (w, v)
+            if final[side][w]:
+                continue
+            if vwLength < D_side[w]:
+                D_side[w] = vwLength
+                P_side[w] = v
+                heapq.heappush(heaps[side], (vwLength, w))
+                pushes += 1
+    profiler.count("heap_pushes", pushes)
+    profiler.count("expanded", expanded)
+    
+    if meeting is None:
+        raise ValueError("bidirectional_grid_shortest_path: no end point is reachable from start")
+    
+    forward, backward = [], []
+    v, w = meeting
+    while v != -1:
+        forward.append(v)
+        v = P[0][v]
+    while w != -1:
+        backward.append(w)
+        w = P[1][w]
+    return [(v//width+top, v%width+left) for v in forward[::-1]+backward]
+
+def min_weight_per_length(edge_weights):
+    """
+    Smallest weight per unit length of the edges in edge_weights (layout of 
+    grid_shortest_path). It is a valid astar_delta for these weights and, for
+    weights computed from an image, usually much larger than the delta of
+    dist_with_prior, which is a bound for any image.
+    """
+    d = np.sqrt([di**2+dj**2 for di,dj in GRID_NEIGHBOURS]).reshape([-1,1,1])
+    return float(np.min(edge_weights/d))
+
+def neighbour_planes(values, subimage, fill=0):
+    """
+    Returns an array with shape [8, bottom-top, right-left] where plane k holds, 
+    for each pixel of subimage = [top, left, bottom, right], the value of its 
+    neighbour in direction GRID_NEIGHBOURS[k]. Neighbours outside the subimage
+    are set to fill.
+    """
+    top, left, bottom, right = subimage
+    crop = values[top:bottom,left:right]
+    padded = np.pad(crop, 1, mode="constant", constant_values=fill)
+    h, w = crop.shape
+    return np.stack([padded[1+di:1+di+h,1+dj:1+dj+w] for di,dj in GRID_NEIGHBOURS])
+
+def edge_weights_with_prior(M, shape_prior, subimage, alpha=0.15, beta=0.25, delta=1.85, beta2=3):
+    """
+    Vectorized equivalent of dist_with_prior. Returns the weights of the edges 
+    of every pixel in subimage = [top, left, bottom, right] to its 8 neighbours 
+    as an array with shape [8, bottom-top, right-left] (see grid_shortest_path).
+    Edges leaving the subimage have infinite weight.
+    """
+    top, left, bottom, right = subimage
+    inside = neighbour_planes(np.ones([bottom-top,right-left], dtype=bool), 
+                              [0,0,bottom-top,right-left], fill=False)
+    # weights are computed in the type of M (float32 or float64)
+    dtype = np.result_type(M.dtype, np.float32)
+    M_u = M[top:bottom,left:right]
+    M_v = neighbour_planes(M, subimage)
+    prior_u = shape_prior[top:bottom,left:right].astype(dtype)
+    prior_v = neighbour_planes(shape_prior, subimage).astype(dtype)
+    d = np.sqrt([di**2+dj**2 for di,dj in GRID_NEIGHBOURS]).reshape([-1,1,1]).astype(dtype)
+    
+    # f = d*(alpha*exp(beta*z+beta2*prior)+delta), in place to avoid temporary planes
+    f = np.minimum(M_u,M_v).astype(dtype)
+    np.subtract(255, f, out=f)
+    f *= beta
+    prior = np.maximum(prior_u,prior_v,out=prior_v)
+    prior *= beta2
+    f += prior
+    del prior, prior_v, M_v
+    np.exp(f, out=f)
+    f *= alpha
+    f += delta
+    f *= d
+    f[~inside] = np.inf
+    return f
+
+def edge_weights_from_matrix(matrix, subimage=None):
+    """
+    Edge weights of the 8-connected grid given the pixel weights computed by
+    dist_matrix: the weight of an edge is its length times the mean weight of 
+    the two pixels, as in shortest_path_grid. Same layout as edge_weights_with_prior.
+    """
+    if subimage is None:
+        subimage = [0,0,matrix.shape[0],matrix.shape[1]]
+    top, left, bottom, right = subimage
+    inside = neighbour_planes(np.ones(matrix.shape, dtype=bool), subimage, fill=False)
+    d = np.sqrt([di**2+dj**2 for di,dj in GRID_NEIGHBOURS]).reshape([-1,1,1])
+    f = d*((matrix[top:bottom,left:right]+neighbour_planes(matrix, subimage))/2)
+    f[~inside] = np.inf
+    return f
+
 def dist_matrix(M):
     """
     Assigns to each pixel a weight based on parameters alpha, beta and delta.
-    Weight decreases as the intensity value increases.
+    Weight decreases as the intensity value increases. The weights have the
+    floating point type of M.
     """
     alpha = 0.15
     beta = 0.1
@@ -168,41 +435,101 @@ def dist_matrix(M):
 
 # Find the shortest path from all the points in the first/last row to any point in 
 #    the last/first row.
-def shortest_path_grid(matrix,start="last"):
-    SQRT2 = np.sqrt(2)
+# The distance table is filled one row at a time: the three candidate moves (diagonal
+# left, vertical, diagonal right) are evaluated for the whole row with shifted slices.
+# The chosen move of each cell is stored so that all columns can be backtracked together.
+# The paths are returned as a list of lists or, if as_list is False, as an integer
+# array with one path per row.
+def shortest_path_grid(matrix,start="last",as_list=True):
+    # distances are computed in the type of matrix (float32 or float64)
+    dtype = np.result_type(matrix.dtype, np.float32)
+    SQRT2 = dtype.type(np.sqrt(2))
     if start == "first":
         matrix = np.flip(matrix,axis=0)
-    distances = np.zeros(matrix.shape)
-    for i in range(1,matrix.shape[0]):
-        for j in range(matrix.shape[1]):
-            local_dists = np.asarray([np.inf]*3)
-            if j>0:
-                local_dists[0] = SQRT2*np.mean([matrix[i,j],matrix[i-1,j-1]])+distances[i-1,j-1]
-            local_dists[1] = np.mean([matrix[i,j],matrix[i-1,j]])+distances[i-1,j]
-            if j<(matrix.shape[1]-1):
-                local_dists[2] = SQRT2*np.mean([matrix[i,j],matrix[i-1,j+1]])+distances[i-1,j+1]
-            distances[i,j] = min(local_dists)
-            
-    shortest_paths = []
-    for j in range(matrix.shape[1]):
-        curr_j = j
-        shortest_paths.append([curr_j])
-        for i in range(matrix.shape[0]-1,0,-1):
-            local_dists = np.asarray([np.inf]*3)
-            if curr_j>0:
-                local_dists[0] = SQRT2*np.mean([matrix[i,curr_j],matrix[i-1,curr_j-1]])+distances[i-1,curr_j-1]
-            local_dists[1] = np.mean([matrix[i,curr_j],matrix[i-1,curr_j]])+distances[i-1,curr_j]
-            if curr_j<(matrix.shape[1]-1):
-                local_dists[2] = SQRT2*np.mean([matrix[i,curr_j],matrix[i-1,curr_j+1]])+distances[i-1,curr_j+1]
-            delta_j = -1 + np.argmin(local_dists)
-            curr_j+=delta_j
-            shortest_paths[-1].append(curr_j)
-        
+    height, width = matrix.shape
+    distances = np.zeros(matrix.shape, dtype=dtype)
+    # predecessor[i,j] is the move (0: j-1, 1: j, 2: j+1) taken from row i to row i-1
+    predecessor = np.ones(matrix.shape, dtype=np.int8)
+    local_dists = np.full([3,width], np.inf, dtype=dtype)
+    for i in range(1,height):
+        local_dists[0,1:] = SQRT2*((matrix[i,1:]+matrix[i-1,:-1])/2)+distances[i-1,:-1]
+        local_dists[1,:] = ((matrix[i,:]+matrix[i-1,:])/2)+distances[i-1,:]
+        local_dists[2,:-1] = SQRT2*((matrix[i,:-1]+matrix[i-1,1:])/2)+distances[i-1,1:]
+        # argmin keeps the first minimum, as the original per-pixel implementation did
+        predecessor[i] = np.argmin(local_dists,axis=0)
+        distances[i] = local_dists[predecessor[i],np.arange(width)]
+    
+    # Backtrack the paths starting at every column of the last row at the same time
+    shortest_paths = np.empty([height,width], dtype=int)
+    shortest_paths[0] = np.arange(width)
+    curr_j = shortest_paths[0]
+    for k,i in enumerate(range(height-1,0,-1)):
+        curr_j = curr_j - 1 + predecessor[i,curr_j]
+        shortest_paths[k+1] = curr_j
+    
+    shortest_paths = shortest_paths.T
     if start == "first":
-        for l in shortest_paths:
-            l.reverse()
+        shortest_paths = shortest_paths[:,::-1]
 
-    return shortest_paths
+    if not as_list:
+        return np.ascontiguousarray(shortest_paths)
+    return shortest_paths.tolist()
+
+# Shortest path through the columns of a polar grid (seam carving). Column a holds the
+# samples of the angle a, at radii r0 + i*dr. The path visits one radius per angle and
+# moves at most one radius step between consecutive angles, from radius index "start"
+# in the first column to radius index "end" in the last one. 
+#    args:
+#        M, prior - gradient magnitude and shape prior sampled in the grid [angles, radii]
+#        radii - radius of each row of the grid, equally spaced
+#        dtheta - angle between consecutive columns (radians)
+#        valid - boolean mask [angles, radii] of the samples that can be visited
+# Each step has the weight of dist_with_prior, with the length of the step in pixels.
+# The table of distances is filled one angle at a time for all radii at once.
+# Returns the radius index of the path at each angle.
+def polar_shortest_path(M, prior, radii, dtheta, start, end, valid=None,
+                        alpha=0.15, beta=0.25, delta=1.85, beta2=3):
+    n_angles, n_radii = M.shape
+    dr = radii[1]-radii[0] if n_radii > 1 else 1
+    if valid is None:
+        valid = np.ones(M.shape, dtype=bool)
+    shifts = (-1, 0, 1)
+    # length of a step from radius index i-shift to radius index i
+    lengths = [np.sqrt((radii*dtheta)**2 + (shift*dr)**2) for shift in shifts]
+    
+    distances = np.full(n_radii, np.inf)
+    distances[start] = 0
+    # predecessor[a,i] is the shift taken to reach radius index i at angle a
+    predecessor = np.ones(M.shape, dtype=np.int8)
+    candidates = np.full([3,n_radii], np.inf)
+    for a in range(1,n_angles):
+        for k,shift in enumerate(shifts):
+            # previous radius index i-shift, shifted slices avoid wrapping around
+            u = slice(max(-shift,0), n_radii-max(shift,0))
+            v = slice(max(shift,0), n_radii-max(-shift,0))
+            z = 255-np.minimum(M[a-1,u],M[a,v])
+            f = lengths[k][v]*(alpha*np.exp(beta*z+beta2*np.maximum(prior[a-1,u],prior[a,v]))+delta)
+            candidates[k,:] = np.inf
+            candidates[k,v] = distances[u]+f
+        predecessor[a] = np.argmin(candidates,axis=0)
+        distances = candidates[predecessor[a],np.arange(n_radii)]
+        distances[~valid[a]] = np.inf
+    
+    if not np.isfinite(distances[end]):
+        raise ValueError("polar_shortest_path: the end point is not reachable from start")
+    path = np.empty(n_angles, dtype=int)
+    path[-1] = end
+    for a in range(n_angles-1,0,-1):
+        path[a-1] = path[a] - shifts[predecessor[a,path[a]]]
+    return path
+
+# Boolean mask of the rows of paths_a that are also rows of paths_b (both integer
+# arrays with one path per row). Each row is hashed by its bytes, so the cost is 
+# linear in the size of the arrays.
+def common_paths(paths_a, paths_b):
+    paths_b = set(row.tobytes() for row in np.ascontiguousarray(paths_b, dtype=paths_a.dtype))
+    return np.fromiter((row.tobytes() in paths_b for row in np.ascontiguousarray(paths_a)),
+                       dtype=bool, count=len(paths_a))
 
 # Euclidean distance between two points
 def compute_euclidean_distance(a,b):
@@ -260,6 +587,27 @@ def gradient(img):
     magnitude = np.sqrt(gx**2+gy**2)
     return magnitude
 
+def color_gradient(img, dtype="float64"):
+    """
+    Gradient magnitude (see gradient) of the mean of the channels of an image.
+    With dtype float64 it is gradient(np.average(img,axis=2)). With float32 no 
+    float64 image is made: the sum of the channels of an uint8 image is kept 
+    exactly in uint16, the Sobel filters are computed by cv2.Sobel in float32 
+    (reflected border, as skimage) and the mean of the channels and the 1/4 
+    normalization of skimage are applied once to the magnitude.
+    """
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        return gradient(np.average(img,axis=2))
+    if dtype != np.float32:
+        raise ValueError("Unsupported dtype %s" % dtype)
+    channels = img.sum(axis=2, dtype=np.uint16 if img.dtype == np.uint8 else np.float32)
+    gx = cv2.Sobel(channels, cv2.CV_32F, 0, 1, ksize=3, borderType=cv2.BORDER_REFLECT)
+    gy = cv2.Sobel(channels, cv2.CV_32F, 1, 0, ksize=3, borderType=cv2.BORDER_REFLECT)
+    magnitude = cv2.magnitude(gx, gy)
+    magnitude *= 1/(4*img.shape[2])
+    return magnitude
+
 def spline(points,n_points=100):
     t = np.arange(0, 1.0000001, 1/n_points)
     x = points[:,0]
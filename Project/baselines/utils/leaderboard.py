@@ -0,0 +1,199 @@
+"""
+Leaderboard evaluation. Scores the predictions.csv of every team against the
+ground truth and writes the markdown table published in Project/leaderboard.
+
+Usage (from the baselines folder):
+    python -m utils.leaderboard --ground-truth /data/y_test.pickle \\
+        --images /data/X_test.pickle --output ../leaderboard/july-9.md \\
+        submissions/*/predictions.csv
+
+The team name is the name of the folder containing each csv file (two files in
+folders with the same name are an error). Submissions are scored in parallel
+and the scores are cached by the content hash of each file, so re-running the
+command only scores new or changed submissions. Invalid submissions (nan
+scores) are not cached and are scored again on the next run.
+"""
+import os
+import sys
+import json
+import pickle
+import hashlib
+import argparse
+import datetime
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import scoring
+
+# Weight of each task in the final (weighted) error
+TASK_WEIGHTS = [('breast', 0.45), ('nipple', 0.35), ('jugular_notch', 0.20)]
+
+# Ground truth shared by the worker processes (set by _init_worker)
+_ground_truth = None
+_imgs_shapes = None
+_ground_truth_curves = None
+
+
+def _init_worker(ground_truth, imgs_shapes, ground_truth_curves):
+    global _ground_truth, _imgs_shapes, _ground_truth_curves
+    _ground_truth = ground_truth
+    _imgs_shapes = imgs_shapes
+    _ground_truth_curves = ground_truth_curves
+
+
+def file_hash(path):
+    """
+    sha256 of the contents of a file.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def ground_truth_hash(ground_truth, imgs_shapes):
+    """
+    Fingerprint of the ground truth, used to invalidate the cache.
+    """
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(ground_truth, dtype=float).tobytes())
+    h.update(np.asarray([shape[0:2] for shape in imgs_shapes], dtype=float).tobytes())
+    return h.hexdigest()
+
+
+def score_submission(path):
+    """
+    Mean score of each task for one predictions file (see TASK_WEIGHTS). Files
+    that cannot be read or do not have one row of 74 values per image get nan
+    scores.
+    """
+    try:
+        predictions = np.loadtxt(path).reshape([-1, 74])
+        if len(predictions) != len(_ground_truth):
+            raise ValueError("%d predictions for %d images" % (len(predictions), len(_ground_truth)))
+        scores = scoring.score_batch(predictions, _ground_truth, _imgs_shapes,
+                                     ground_truth_curves=_ground_truth_curves)
+        return [float(np.mean(scores[task])) for task, _ in TASK_WEIGHTS]
+    except Exception as e:
+        print("\tInvalid submission %s: %s" % (path, e))
+        return [float('nan')] * len(TASK_WEIGHTS)
+
+
+def submission_teams(paths):
+    """
+    Dictionary {team: path} of the predictions files, the team being the name
+    of the folder containing each file. Raises ValueError if different files
+    are in folders with the same name.
+    """
+    submissions = {}
+    for path in paths:
+        team = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        if team in submissions and os.path.abspath(submissions[team]) != os.path.abspath(path):
+            raise ValueError("Submissions %s and %s are both of team %s"
+                             % (submissions[team], path, team))
+        submissions[team] = path
+    return submissions
+
+
+def weighted_error(task_scores):
+    return sum(weight * score for (_, weight), score in zip(TASK_WEIGHTS, task_scores))
+
+
+def evaluate(submissions, ground_truth, imgs_shapes, cache_path=None, workers=None):
+    """
+    Scores the submissions, a dictionary {team: path to predictions csv}.
+    Returns a dictionary {team: [weighted error, *task scores]}.
+    Scores are cached in cache_path (json) by the content hash of each file and
+    only the files not in the cache are scored, in a pool of worker processes.
+    Invalid submissions (nan scores) are not cached, so they are scored again.
+    """
+    ground_truth = np.asarray(ground_truth, dtype=float).reshape([-1, 74])
+    gt_hash = ground_truth_hash(ground_truth, imgs_shapes)
+
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if cache.get('ground_truth') != gt_hash:
+            cache = {}
+    cached_scores = {h: task_scores for h, task_scores in cache.get('scores', {}).items()
+                     if not np.any(np.isnan(task_scores))}
+
+    hashes = {team: file_hash(path) for team, path in submissions.items()}
+    scores = dict(cached_scores)
+    pending = {}
+    for team, path in submissions.items():
+        if hashes[team] not in scores:
+            pending.setdefault(hashes[team], path)
+
+    if pending:
+        print("Scoring %d submissions (%d cached)" % (len(pending), len(submissions) - len(pending)))
+        curves = scoring.ground_truth_splines(ground_truth, imgs_shapes)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(ground_truth, imgs_shapes, curves)) as executor:
+            results = executor.map(score_submission, pending.values())
+            for h, task_scores in zip(pending, results):
+                scores[h] = task_scores
+                if not np.any(np.isnan(task_scores)):
+                    cached_scores[h] = task_scores
+
+    if cache_path:
+        with open(cache_path, 'w') as f:
+            json.dump({'ground_truth': gt_hash, 'scores': cached_scores}, f, indent=1)
+
+    return {team: [weighted_error(scores[hashes[team]]), *scores[hashes[team]]]
+            for team in submissions}
+
+
+def markdown_table(results, title="Daily Leader Board"):
+    """
+    Leaderboard in the markdown format of Project/leaderboard. Teams are sorted
+    by weighted error, invalid submissions (nan) last.
+    """
+    ranking = sorted(results.items(), key=lambda item: (np.isnan(item[1][0]), item[1][0]))
+    lines = ["# %s" % title,
+             "",
+             "|| Team | Weighted Error | Breast Contour 45% | Nipples 35% | Sternal Notch 20% |",
+             "| :---: | :---: | :---: | :---: | :---: | :---: |"]
+    for position, (team, scores) in enumerate(ranking, 1):
+        lines.append("| %d | %s | %s |" % (position, team, " | ".join("%.4f" % s for s in scores)))
+    lines += ["", "*Last update: %s*" % datetime.datetime.now()]
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leaderboard evaluation")
+    parser.add_argument("submissions", nargs="+",
+                        help="predictions csv files, the team is the name of their folder")
+    parser.add_argument("--ground-truth", default="/data/y_test.pickle",
+                        help="pickle file with the ground truth keypoints")
+    parser.add_argument("--images", default="/data/X_test.pickle",
+                        help="pickle file with the test images (only their shapes are used)")
+    parser.add_argument("--output", default=None,
+                        help="markdown file to write (printed if not given)")
+    parser.add_argument("--title", default="Daily Leader Board")
+    parser.add_argument("--cache", default="leaderboard_cache.json",
+                        help="json file with the scores of the submissions already evaluated")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    with open(args.ground_truth, 'rb') as f:
+        ground_truth = pickle.load(f)
+    with open(args.images, 'rb') as f:
+        imgs_shapes = [np.shape(img) for img in pickle.load(f)]
+
+    submissions = submission_teams(args.submissions)
+    results = evaluate(submissions, ground_truth, imgs_shapes,
+                       cache_path=args.cache, workers=args.workers)
+    table = markdown_table(results, title=args.title)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(table)
+    else:
+        print(table)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Lightweight profiling of the stages of a pipeline (e.g. baseline1.model.test).
+
+    from utils import profiler
+
+    prof = profiler.Profile()
+    with prof:
+        with profiler.stage("gradient"):
+            ...
+        profiler.count("heap_pushes", n)
+
+    prof.times     # {"gradient": seconds}
+    prof.counters  # {"heap_pushes": n}
+
+Stages can be nested and are then named "outer/inner", counters are named
+after the stage where they are counted. A stage entered more than once in a
+profile (e.g. one for each breast) accumulates its time. The time of a stage
+is recorded even if it raises, and the profile keeps the stage that failed.
+Outside of an active Profile, stage and count do nothing, so the instrumented
+code can always call them.
+
+The profiles of a batch of images are aggregated with summarize (p50, p95 and
+maximum of every stage and counter) and written with write_json or write_csv.
+"""
+import csv
+import json
+import time
+import threading
+import contextlib
+import numpy as np
+
+_local = threading.local()
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def active():
+    """Profile active in this thread, or None"""
+    stack = _stack()
+    return stack[-1][0] if stack else None
+
+
+class Profile(object):
+    def __init__(self, name=""):
+        """
+        Times and counters of one run of the pipeline (one image). It is
+        activated, in the current thread, with a "with" statement.
+        """
+        self.name = name
+        self.times = {}
+        self.counters = {}
+        self.total = 0.0
+        self.error = None
+        self.failed_stage = None
+
+    def __enter__(self):
+        _stack().append((self, []))
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.total += time.perf_counter() - self._start
+        _stack().pop()
+        if exc_type is not None and self.error is None:
+            self.error = exc_type.__name__
+        return False
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def add_count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        """Plain dictionary (json serializable, can be sent between processes)"""
+        return {"name": self.name, "total": self.total, "error": self.error,
+                "failed_stage": self.failed_stage,
+                "times": dict(self.times), "counters": dict(self.counters)}
+
+    def format_times(self, precision=2):
+        """Times of the top level stages, as "stage 0.12 other 1.30 ..." """
+        return " ".join("%s %.*f" % (name, precision, seconds)
+                        for name, seconds in self.times.items() if "/" not in name)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Measures the time spent in the block as the stage name of the active profile"""
+    stack = _stack()
+    if not stack:
+        yield
+        return
+    prof, names = stack[-1]
+    names.append(name)
+    full_name = "/".join(names)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if prof.failed_stage is None:
+            prof.failed_stage = full_name
+        raise
+    finally:
+        prof.add_time(full_name, time.perf_counter() - start)
+        names.pop()
+
+
+def count(name, value=1):
+    """Adds value to the counter name (in the current stage) of the active profile"""
+    stack = _stack()
+    if stack:
+        prof, names = stack[-1]
+        prof.add_count("/".join(names + [name]), value)
+
+
+def _as_dict(profile):
+    return profile.as_dict() if isinstance(profile, Profile) else profile
+
+
+def _statistics(values):
+    values = np.asarray(values, dtype=float)
+    return {"count": len(values),
+            "mean": float(values.mean()),
+            "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "max": float(values.max()),
+            "total": float(values.sum())}
+
+
+def summarize(profiles):
+    """
+    Aggregates a list of profiles (Profile or Profile.as_dict()). Returns a
+    dictionary with the number of images, the failures (stage where each one
+    failed) and the statistics of the total time, of each stage and of each
+    counter over the images where they were recorded.
+    """
+    profiles = [_as_dict(p) for p in profiles]
+    times, counters, failures = {}, {}, {}
+    for p in profiles:
+        for name, value in p["times"].items():
+            times.setdefault(name, []).append(value)
+        for name, value in p["counters"].items():
+            counters.setdefault(name, []).append(value)
+        if p["error"] is not None:
+            stage_name = p["failed_stage"] or ""
+            failures[stage_name] = failures.get(stage_name, 0) + 1
+
+    summary = {"images": len(profiles), "failures": failures, "stages": {}, "counters": {}}
+    if profiles:
+        summary["total"] = _statistics([p["total"] for p in profiles])
+    summary["stages"] = {name: _statistics(values) for name, values in times.items()}
+    summary["counters"] = {name: _statistics(values) for name, values in counters.items()}
+    return summary
+
+
+def write_json(path, profiles):
+    """Writes the summary and the profile of every image"""
+    profiles = [_as_dict(p) for p in profiles]
+    with open(path, "w") as f:
+        json.dump({"summary": summarize(profiles), "profiles": profiles}, f, indent=1)
+
+
+CSV_FIELDS = ["kind", "name", "count", "mean", "p50", "p95", "max", "total"]
+
+
+def write_csv(path, profiles):
+    """Writes the summary, one row per stage and counter"""
+    summary = summarize(profiles)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        rows = [("total", "total", summary["total"])] if "total" in summary else []
+        rows += [("stage", name, s) for name, s in summary["stages"].items()]
+        rows += [("counter", name, s) for name, s in summary["counters"].items()]
+        for kind, name, s in rows:
+            writer.writerow([kind, name] + [s[field] for field in CSV_FIELDS[2:]])
+
+
+def write(path, profiles):
+    """write_csv if path ends with .csv, write_json otherwise"""
+    if path.lower().endswith(".csv"):
+        write_csv(path, profiles)
+    else:
+        write_json(path, profiles)
+
+
+def format_summary(summary):
+    """Text table with the p50, p95 and maximum of each stage, in seconds"""
+    lines = ["%-40s %8s %8s %8s" % ("stage", "p50", "p95", "max")]
+    rows = ([("total", summary["total"])] if "total" in summary else []) + list(summary["stages"].items())
+    for name, s in rows:
+        lines.append("%-40s %8.3f %8.3f %8.3f" % (name, s["p50"], s["p95"], s["max"]))
+    for name, s in summary["counters"].items():
+        lines.append("%-40s %8.0f %8.0f %8.0f" % (name, s["p50"], s["p95"], s["max"]))
+    for stage_name, n in summary["failures"].items():
+        lines.append("failed in %s: %d" % (stage_name or "(outside stages)", n))
+    return "\n".join(lines)
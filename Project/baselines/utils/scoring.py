@@ -1,12 +1,16 @@
 from shapely.geometry import LineString, Point
 import numpy as np
 import scipy.interpolate as interpolate
+from scipy.spatial import cKDTree
 import pickle as pkl
 import sys
 import os
 
 
 
+# Fields of the structured array returned by score_batch, one per task
+SCORE_DTYPE = np.dtype([('breast', float), ('nipple', float), ('jugular_notch', float)])
+
 def generate_scores(predictions, ground_truth, imgs_shapes):
     """
     Receives three lists predictions, ground_truths and imgs_shapes and 
@@ -16,15 +20,69 @@ def generate_scores(predictions, ground_truth, imgs_shapes):
     assert len(predictions) == len(ground_truth)
     assert len(predictions) == len(imgs_shapes)
     
-    all_distances = []
-    for i in range(len(predictions)):
-        ori_shape = imgs_shapes[i]
-        dets = predictions[i]
-        grth = ground_truth[i]
-        distances = measure_distances(dets, grth, ori_shape)
-        all_distances.append(distances)
+    scores = score_batch(predictions, ground_truth, imgs_shapes)
+    all_distances = [list(score) for score in scores.tolist()]
     return all_distances
+
+def score_batch(predictions, ground_truth, imgs_shapes, ground_truth_curves=None):
+    """
+    Vectorized version of measure_distances for a whole set of images. 
+    predictions and ground_truth are [N,74] arrays and imgs_shapes the N 
+    original shapes. Returns a structured array with one entry per image and
+    one field per task (see SCORE_DTYPE).
+    The curve distances are computed with point_to_polyline_distance instead
+    of Shapely, the results agree to floating point precision.
+    The splines of the ground truth curves do not depend on the predictions. 
+    When several sets of predictions are scored they can be computed once with 
+    ground_truth_splines and passed as ground_truth_curves.
+    """
+    predictions = np.asarray(predictions, dtype=float).reshape([-1,74])
+    ground_truth = np.asarray(ground_truth, dtype=float).reshape([-1,74])
+    shapes = np.asarray([shape[0:2] for shape in imgs_shapes], dtype=float).reshape([-1,2])
+    assert predictions.shape == ground_truth.shape
+    assert len(predictions) == len(shapes)
+    
+    # diagonal line length (used to normalize the error of each point)
+    diagonal_shape = np.sqrt(np.sum(shapes**2, axis=1))
+    
+    # compute the error for each point
+    point_errors = np.sqrt(np.sum((ground_truth[:,68:74]-predictions[:,68:74]).reshape([-1,3,2])**2, axis=2))
+    jugular_notch_error = point_errors[:,0]
+    nipple_error = (point_errors[:,1]+point_errors[:,2])/2
+    
+    # compute the error for each boundary (the splines are different for every image)
+    if ground_truth_curves is None:
+        ground_truth_curves = ground_truth_splines(ground_truth, imgs_shapes)
+    breast_error = np.empty(len(predictions))
+    for i in range(len(predictions)):
+        l_curve, r_curve = ground_truth_curves[i]
+        l_breast_error = get_curves_distance_np(ground_truth[i,0:34], predictions[i,0:34],
+                                                n_points=diagonal_shape[i], curve_a=l_curve)
+        r_breast_error = get_curves_distance_np(ground_truth[i,34:68], predictions[i,34:68],
+                                                n_points=diagonal_shape[i], curve_a=r_curve)
+        breast_error[i] = (l_breast_error+r_breast_error)/2
+    
+    # normalize all errors
+    scores = np.empty(len(predictions), dtype=SCORE_DTYPE)
+    scores['breast'] = breast_error/diagonal_shape
+    scores['nipple'] = nipple_error/diagonal_shape
+    scores['jugular_notch'] = jugular_notch_error/diagonal_shape
+    return scores
     
+def ground_truth_splines(ground_truth, imgs_shapes):
+    """
+    Splines through the left and right breast contours of each ground truth, 
+    as used by score_batch. Returns a list with a pair of [n_points+1,2] arrays 
+    per image.
+    """
+    ground_truth = np.asarray(ground_truth, dtype=float).reshape([-1,74])
+    curves = []
+    for grth, shape in zip(ground_truth, imgs_shapes):
+        n_points = compute_euclidean_distance(np.zeros([2]), [*shape[0:2]])
+        curves.append((np.stack(spline(grth[0:34].reshape([-1,2]),n_points),axis=1),
+                       np.stack(spline(grth[34:68].reshape([-1,2]),n_points),axis=1)))
+    return curves
+
 def measure_distances(detections, keypoints, ori_shape):
     """
     Receives a list with the detected points, the ground_truth points and the 
@@ -96,6 +154,65 @@ def curve_dist_aux(curve_points,points,n_points):
     distance/=len(points)
     return distance
     
+def get_curves_distance_np(points_a,points_b,n_points,curve_a=None):
+    """
+    Same as get_curves_distance, using point_to_polyline_distance instead of
+    Shapely. The spline through points_a can be given in curve_a if it was 
+    already computed.
+    """
+    points_a = points_a.reshape([-1,2])
+    points_b = points_b.reshape([-1,2])
+    if curve_a is None:
+        curve_a = np.stack(spline(points_a,n_points),axis=1)
+    
+    distance = np.mean(point_to_polyline_distance(points_b, curve_a))
+    distance+= np.mean(point_to_polyline_distance(points_a, np.stack(spline(points_b,n_points),axis=1)))
+    distance/=2
+    return distance
+
+def point_to_polyline_distance(points, polyline):
+    """
+    Distance of each of the points ([P,2] array) to the polyline ([S+1,2] array
+    of vertices). Equivalent to LineString(polyline).distance(Point(point)) for 
+    each point.
+    The closest vertex of each point is found with a KD-tree. If it is at 
+    distance r, the closest segment must have a vertex closer than r plus the 
+    largest segment length, so only those segments are evaluated.
+    """
+    points = np.asarray(points, dtype=float).reshape([-1,2])
+    polyline = np.asarray(polyline, dtype=float)
+    segments = np.diff(polyline, axis=0)
+    max_length = np.sqrt(np.max(np.sum(segments**2, axis=1)))
+    
+    tree = cKDTree(polyline)
+    closest_vertex_distance, _ = tree.query(points)
+    candidates = tree.query_ball_point(points, closest_vertex_distance+max_length)
+    
+    # Flat list of (point, segment) pairs: each candidate vertex v belongs to the
+    # segments v-1 and v
+    point_index = np.repeat(np.arange(len(points)), [len(c) for c in candidates])
+    vertex_index = np.concatenate(candidates).astype(int)
+    point_index = np.concatenate([point_index, point_index])
+    segment_index = np.concatenate([vertex_index-1, vertex_index])
+    valid = (segment_index>=0) & (segment_index<len(segments))
+    point_index = point_index[valid]
+    segment_index = segment_index[valid]
+    
+    # Projection of each point in each segment, clamped to the segment
+    # (degenerate segments are handled as points)
+    p = points[point_index]
+    a = polyline[segment_index]
+    d = segments[segment_index]
+    length2 = d[:,0]**2+d[:,1]**2
+    t = (p[:,0]-a[:,0])*d[:,0] + (p[:,1]-a[:,1])*d[:,1]
+    t = np.divide(t, length2, out=np.zeros_like(t), where=length2>0)
+    np.clip(t, 0, 1, out=t)
+    distances2 = (p[:,0]-a[:,0]-t*d[:,0])**2 + (p[:,1]-a[:,1]-t*d[:,1])**2
+    
+    min_distances2 = np.full(len(points), np.inf)
+    np.minimum.at(min_distances2, point_index, distances2)
+    return np.sqrt(min_distances2)
+    
 def spline(points,n_points=100):
     t = np.arange(0, 1.0000001, 1/n_points)
     x = points[:,0]